@@ -0,0 +1,186 @@
+# Runs many Brewin programs in parallel on a pool of worker processes, each with
+# the interpreter already imported, and writes one JSON result per job to stdout,
+# in the order the jobs were given.
+#
+#     python batch_runner.py JOBS [--workers N] [--timeout SECONDS]
+#                                 [--version {1,2,3,4}] [--engine ENGINE]
+#
+# JOBS is either a directory, where each *.br file is a job whose inputs are the
+# lines of the .in file with the same name (if there is one), or a JSONL manifest
+# with one job per line:
+#
+#     {"id": "t1", "path": "tests/t1.br", "inputs": ["5", "6"]}
+#     {"id": "t2", "source": "func main() { print(1); }"}
+#
+# where path is relative to the manifest. Each result has the job's id, its
+# output_log, the error type and line from get_error_type_and_line() and a status:
+# "ok", "error" (the program raised a Brewin error), "timeout" or "crash" (the
+# interpreter raised something else, reported in "message").
+import argparse
+import importlib
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import brewparse  # noqa: F401 (imported before the workers start, so they share it)
+
+VERSIONS = (1, 2, 3, 4)
+
+
+class JobTimeout(BaseException):
+    # a BaseException so the interpreter's own `except Exception` can't swallow it
+    pass
+
+
+# set up in each worker by init_worker
+interpreter_class = None
+interpreter_options = {}
+
+
+def init_worker(version, engine):
+    global interpreter_class, interpreter_options
+    interpreter_class = importlib.import_module(f"interpreterv{version}").Interpreter
+    interpreter_options = {} if engine is None else {"engine": engine}
+    # a program reading more input than its job has gets an error, not a hang, and
+    # nothing the interpreter or parser prints gets mixed into the results
+    sys.stdin = open(os.devnull)
+    sys.stdout = open(os.devnull, "w")
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, raise_timeout)
+
+
+def raise_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def run_job(job, timeout=None):
+    interpreter = interpreter_class(
+        console_output=False, inp=job.get("inputs", []), **interpreter_options
+    )
+    result = {"id": job["id"]}
+    start = time.perf_counter()
+    timed = timeout is not None and hasattr(signal, "setitimer")
+    try:
+        if timed:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            interpreter.run(job["source"])
+        finally:
+            if timed:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        result["status"] = "ok"
+    except JobTimeout:
+        result["status"] = "timeout"
+    except Exception as e:
+        if interpreter.get_error_type_and_line()[0] is not None:
+            result["status"] = "error"
+        else:
+            result["status"] = "crash"
+            result["message"] = f"{type(e).__name__}: {e}"
+    error_type, error_line = interpreter.get_error_type_and_line()
+    result["output"] = interpreter.get_output()
+    result["error_type"] = None if error_type is None else error_type.name
+    result["error_line"] = error_line
+    result["seconds"] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def load_jobs(path):
+    if os.path.isdir(path):
+        return load_directory(path)
+    return load_manifest(path)
+
+
+def load_directory(directory):
+    jobs = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".br"):
+            continue
+        program_path = os.path.join(directory, name)
+        input_path = program_path[: -len(".br")] + ".in"
+        inputs = []
+        if os.path.exists(input_path):
+            with open(input_path) as f:
+                inputs = f.read().splitlines()
+        with open(program_path) as f:
+            jobs.append({"id": name, "source": f.read(), "inputs": inputs})
+    return jobs
+
+
+def load_manifest(manifest_path):
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "source" in entry:
+                source = entry["source"]
+            elif "path" in entry:
+                with open(os.path.join(base_dir, entry["path"])) as program_file:
+                    source = program_file.read()
+            else:
+                raise ValueError(f"job on line {line_number} has no source or path")
+            job_id = entry.get("id", entry.get("path", str(line_number)))
+            jobs.append({"id": job_id, "source": source, "inputs": entry.get("inputs", [])})
+    return jobs
+
+
+# raises ValueError for options no worker could run jobs with
+def check_options(version, engine=None, timeout=None):
+    if version not in VERSIONS:
+        raise ValueError(f"Unknown interpreter version {version}")
+    if engine is not None:
+        if version != 4:
+            raise ValueError(f"Interpreter version {version} has no execution engines")
+        engines = importlib.import_module("interpreterv4").Interpreter.ENGINES
+        if engine not in engines:
+            raise ValueError(f"Unknown execution engine {engine}")
+    if timeout is not None and timeout <= 0:
+        raise ValueError("timeout must be positive")
+
+
+# returns an iterator over each job's result, in the order of jobs
+def run_batch(jobs, workers=None, timeout=None, version=4, engine=None):
+    # checked here rather than in the generator, so bad arguments fail at the call
+    # instead of in every worker's initializer
+    check_options(version, engine, timeout)
+    return run_jobs(jobs, workers or os.cpu_count() or 1, timeout, version, engine)
+
+
+def run_jobs(jobs, workers, timeout, version, engine):
+    # big enough chunks that short jobs aren't dominated by the trip to the worker,
+    # small enough that every worker gets several of them
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(version, engine)
+    ) as executor:
+        yield from executor.map(
+            run_job, jobs, [timeout] * len(jobs), chunksize=chunksize
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Brewin programs in parallel.")
+    parser.add_argument("jobs", help="directory of .br files or JSONL manifest")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per job")
+    parser.add_argument("--version", type=int, default=4, choices=VERSIONS)
+    parser.add_argument("--engine", default=None, help="v4 execution engine")
+    args = parser.parse_args()
+    try:
+        results = run_batch(
+            load_jobs(args.jobs), args.workers, args.timeout, args.version, args.engine
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    for result in results:
+        print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    main()
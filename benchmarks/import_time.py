@@ -0,0 +1,65 @@
+# Measures how long `import brewparse` takes in a fresh interpreter, with the
+# shipped lextab.py/parsetab.py and with the tables missing (which is what every
+# import paid before the tables were shipped). Also checks that importing writes
+# no files (other than the usual __pycache__).
+#
+#     python benchmarks/import_time.py [runs]
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# let the warm-up run cache bytecode, like a normal deployment would
+ENV = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+SNIPPET = (
+    "import time; start = time.perf_counter(); import brewparse; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def time_import(source_dir, runs):
+    times = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", SNIPPET],
+            cwd=source_dir,
+            env=ENV,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times.append(float(result.stdout.split()[-1]))
+    return statistics.median(times) * 1000
+
+
+def copy_sources(dest, with_tables):
+    for name in os.listdir(SOURCE_DIR):
+        if not name.endswith(".py"):
+            continue
+        if not with_tables and name in ("lextab.py", "parsetab.py"):
+            continue
+        shutil.copy(os.path.join(SOURCE_DIR, name), dest)
+    shutil.copytree(os.path.join(SOURCE_DIR, "ply"), os.path.join(dest, "ply"))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for with_tables in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            copy_sources(tmp, with_tables)
+            # warm up the bytecode cache so only the import itself is measured
+            subprocess.run([sys.executable, "-c", "import brewparse"], cwd=tmp,
+                           env=ENV, capture_output=True, check=True)
+            before = set(os.listdir(tmp)) - {"__pycache__"}
+            median = time_import(tmp, runs)
+            written = sorted(set(os.listdir(tmp)) - {"__pycache__"} - before)
+        label = "shipped tables" if with_tables else "no tables"
+        print(f"{label:>15}: {median:7.2f} ms median over {runs} runs, "
+              f"files written: {written or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# Times the tight integer loop `while (i < n) { i = i + 1; }` on each engine, which
+# is dominated by int arithmetic and comparisons.
+#
+#     python benchmarks/int_loop.py [iterations] [runs]
+import os
+import statistics
+import sys
+import time
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SOURCE_DIR)
+
+from interpreterv4 import Interpreter  # noqa: E402
+
+PROGRAM = """
+func main() {
+  n = %d;
+  i = 0;
+  while (i < n) {
+    i = i + 1;
+  }
+  print(i);
+}
+"""
+
+
+def time_loop(engine, iterations, runs):
+    source = PROGRAM % iterations
+    times = []
+    for _ in range(runs):
+        interpreter = Interpreter(console_output=False, engine=engine)
+        start = time.perf_counter()
+        interpreter.run(source)
+        times.append(time.perf_counter() - start)
+        assert interpreter.get_output() == [str(iterations)]
+    return statistics.median(times) * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for engine in sorted(Interpreter.ENGINES):
+        median = time_loop(engine, iterations, runs)
+        print(f"{engine:>5}: {median:8.1f} ms median over {runs} runs "
+              f"of {iterations} iterations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Times a program that prints n lines with each kind of output sink (see
+# output_sinks.py), with stdout pointed at /dev/null so the terminal's speed doesn't
+# count. "print+capture" is how the interpreter always handled output.
+#
+#     python benchmarks/print_lines.py [lines] [engine]
+import os
+import sys
+import time
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SOURCE_DIR)
+
+from interpreterv4 import Interpreter  # noqa: E402
+from output_sinks import BufferedSink, FileSink, NullSink  # noqa: E402
+
+PROGRAM = """
+func main() {
+  n = %d;
+  i = 0;
+  while (i < n) {
+    print(i);
+    i = i + 1;
+  }
+}
+"""
+
+SINKS = {
+    "print+capture": lambda: (True, True),
+    "buffered": lambda: (BufferedSink(), False),
+    "buffered+ring": lambda: (BufferedSink(), 1000),
+    "file": lambda: (FileSink(os.devnull), False),
+    "null": lambda: (NullSink(), False),
+}
+
+
+def time_sink(make_sinks, source, engine):
+    console_output, capture_output = make_sinks()
+    interpreter = Interpreter(
+        console_output=console_output, capture_output=capture_output, engine=engine
+    )
+    start = time.perf_counter()
+    interpreter.run(source)
+    elapsed = time.perf_counter() - start
+    if isinstance(console_output, FileSink):
+        console_output.close()
+    return elapsed, len(interpreter.get_output())
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    engine = sys.argv[2] if len(sys.argv) > 2 else "python"
+    source = PROGRAM % lines
+    results = []
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            for name, make_sinks in SINKS.items():
+                results.append((name, *time_sink(make_sinks, source, engine)))
+        finally:
+            sys.stdout = stdout
+    for name, elapsed, kept in results:
+        print(f"{name:>13}: {elapsed:7.2f} s for {lines} lines on {engine}, "
+              f"{kept} kept for get_output")
+
+
+if __name__ == "__main__":
+    main()
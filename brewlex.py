@@ -1,3 +1,5 @@
+import zlib
+
 from ply import lex
 
 reserved = (
@@ -126,5 +128,16 @@ def t_error(t):
     t.lexer.skip(1)
 
 
-# Build the lexer
-lex.lex()
+# Build the lexer. The master regular expressions are loaded from lextab.py
+# (regenerate it with build_tables.py) as long as it was built from this exact
+# file; otherwise they are rebuilt from the rules above, without writing lextab.py.
+try:
+    import lextab
+
+    with open(__file__, "rb") as rules_file:
+        lextab_is_current = (
+            lextab.rules_crc == zlib.crc32(rules_file.read())
+        )
+except (ImportError, AttributeError, OSError):
+    lextab_is_current = False
+lex.lex(optimize=lextab_is_current, lextab="lextab")
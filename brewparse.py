@@ -1,4 +1,27 @@
-from element import Element
+import os
+
+from element import (
+    Arg,
+    Assign,
+    BinOp,
+    BoolLiteral,
+    FCall,
+    FuncDef,
+    If,
+    IntLiteral,
+    LambdaDef,
+    MCall,
+    Neg,
+    NewObject,
+    Nil,
+    Not,
+    Program,
+    RefArg,
+    Return,
+    StringLiteral,
+    Var,
+    While,
+)
 from brewlex import *
 from intbase import InterpreterBase
 from ply import yacc
@@ -25,7 +48,7 @@ def collapse_items(p, group_index, singleton_index):
 
 def p_program(p):
     "program : funcs"
-    p[0] = Element(InterpreterBase.PROGRAM_DEF, functions=p[1])
+    p[0] = Program(p[1])
 
 
 def p_funcs(p):
@@ -38,18 +61,18 @@ def p_func(p):
     """func : FUNC NAME LPAREN formal_args RPAREN LBRACE statements RBRACE
     | FUNC NAME LPAREN RPAREN LBRACE statements RBRACE"""
     if len(p) == 9:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.FUNC_DEF, name=p[2], args=p[4], statements=p[7])
+        p[0] = FuncDef(p[2], p[4], p[7])
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.FUNC_DEF, name=p[2], args=[], statements=p[6])
+        p[0] = FuncDef(p[2], [], p[6])
 
 
 def p_lambda(p):
     """lambda : LAMBDA LPAREN formal_args RPAREN LBRACE statements RBRACE
     | LAMBDA LPAREN RPAREN LBRACE statements RBRACE"""
     if len(p) == 8:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.LAMBDA_DEF, args=p[3], statements=p[6])
+        p[0] = LambdaDef(p[3], p[6])
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.LAMBDA_DEF, args=[], statements=p[5])
+        p[0] = LambdaDef([], p[5])
 
 
 def p_formal_args(p):
@@ -60,12 +83,12 @@ def p_formal_args(p):
 
 def p_formal_arg(p):
     "formal_arg : NAME"
-    p[0] = Element(InterpreterBase.ARG_DEF, name=p[1])
+    p[0] = Arg(p[1])
 
 
 def p_formal_ref_arg(p):
     "formal_arg : REF NAME"
-    p[0] = Element(InterpreterBase.REFARG_DEF, name=p[2])
+    p[0] = RefArg(p[2])
 
 
 def p_statements(p):
@@ -76,7 +99,7 @@ def p_statements(p):
 
 def p_statement___assign(p):
     "statement : variable ASSIGN expression SEMI"
-    p[0] = Element("=", name=p[1], expression=p[3])
+    p[0] = Assign(p[1], p[3])
 
 
 def p_variable(p):
@@ -93,24 +116,14 @@ def p_statement_if(p):
     | IF LPAREN expression RPAREN LBRACE statements RBRACE ELSE LBRACE statements RBRACE
     """
     if len(p) == 8:
-        p[0] = Element(
-            InterpreterBase.IF_DEF,
-            condition=p[3],
-            statements=p[6],
-            else_statements=None,
-        )
+        p[0] = If(p[3], p[6], None)
     else:
-        p[0] = Element(
-            InterpreterBase.IF_DEF,
-            condition=p[3],
-            statements=p[6],
-            else_statements=p[10],
-        )
+        p[0] = If(p[3], p[6], p[10])
 
 
 def p_statement_while(p):
     "statement : WHILE LPAREN expression RPAREN LBRACE statements RBRACE"
-    p[0] = Element(InterpreterBase.WHILE_DEF, condition=p[3], statements=p[6])
+    p[0] = While(p[3], p[6])
 
 
 def p_statement_expr(p):
@@ -125,17 +138,17 @@ def p_statement_return(p):
         expr = p[2]
     else:
         expr = None
-    p[0] = Element(InterpreterBase.RETURN_DEF, expression=expr)
+    p[0] = Return(expr)
 
 
 def p_expression_not(p):
     "expression : NOT expression"
-    p[0] = Element(InterpreterBase.NOT_DEF, op1=p[2])
+    p[0] = Not(p[2])
 
 
 def p_expression_uminus(p):
     "expression : MINUS expression %prec UMINUS"
-    p[0] = Element(InterpreterBase.NEG_DEF, op1=p[2])
+    p[0] = Neg(p[2])
 
 
 def p_arith_expression_binop(p):
@@ -149,7 +162,7 @@ def p_arith_expression_binop(p):
     | expression MINUS expression
     | expression MULTIPLY expression
     | expression DIVIDE expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = BinOp(p[2], p[1], p[3])
 
 
 def p_expression_group(p):
@@ -160,12 +173,12 @@ def p_expression_group(p):
 def p_expression_and_or(p):
     """expression : expression OR expression
     | expression AND expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = BinOp(p[2], p[1], p[3])
 
 
 def p_expression_number(p):
     "expression : NUMBER"
-    p[0] = Element(InterpreterBase.INT_DEF, val=p[1])
+    p[0] = IntLiteral(p[1])
 
 
 def p_expression_lambda(p):
@@ -177,47 +190,47 @@ def p_expression_bool(p):
     """expression : TRUE
     | FALSE"""
     bool_val = p[1] == InterpreterBase.TRUE_DEF
-    p[0] = Element(InterpreterBase.BOOL_DEF, val=bool_val)
+    p[0] = BoolLiteral(bool_val)
 
 
 def p_expression_nil(p):
     "expression : NIL"
-    p[0] = Element(InterpreterBase.NIL_DEF)
+    p[0] = Nil()
 
 
 def p_expression_obj(
     p,
 ):  # e.g. a = @;   ### creates a new dictionary/object and stores in a
     "expression : AT"
-    p[0] = Element(InterpreterBase.OBJ_DEF)
+    p[0] = NewObject()
 
 
 def p_expression_string(p):
     "expression : STRING"
-    p[0] = Element(InterpreterBase.STRING_DEF, val=p[1])
+    p[0] = StringLiteral(p[1])
 
 
 def p_expression_variable(p):
     "expression : variable"
-    p[0] = Element(InterpreterBase.VAR_DEF, name=p[1])
+    p[0] = Var(p[1])
 
 
 def p_func_call(p):
     """expression : NAME LPAREN args RPAREN
     | NAME LPAREN RPAREN"""
     if len(p) == 5:
-        p[0] = Element(InterpreterBase.FCALL_DEF, name=p[1], args=p[3])
+        p[0] = FCall(p[1], p[3])
     else:
-        p[0] = Element(InterpreterBase.FCALL_DEF, name=p[1], args=[])
+        p[0] = FCall(p[1], [])
 
 
 def p_method_call(p):
     """expression : NAME DOT NAME LPAREN args RPAREN
     | NAME DOT NAME LPAREN RPAREN"""
     if len(p) == 7:
-        p[0] = Element(InterpreterBase.MCALL_DEF, objref=p[1], name=p[3], args=p[5])
+        p[0] = MCall(p[1], p[3], p[5])
     else:
-        p[0] = Element(InterpreterBase.MCALL_DEF, objref=p[1], name=p[3], args=[])
+        p[0] = MCall(p[1], p[3], [])
 
 
 def p_expression_args(p):
@@ -233,13 +246,43 @@ def p_error(p):
         print("Syntax error at EOF")
 
 
+# on-disk AST cache used by parse_program; off unless enabled below or through
+# the BREWIN_PARSE_CACHE environment variable (a cache directory)
+parse_cache = None
+
+
+def enable_parse_cache(cache_dir, max_bytes=None):
+    # imported here so programs that never use the cache don't pay for it at startup
+    from parse_cache import ParseCache, DEFAULT_MAX_BYTES
+
+    global parse_cache
+    parse_cache = ParseCache(cache_dir, max_bytes or DEFAULT_MAX_BYTES)
+
+
+def disable_parse_cache():
+    global parse_cache
+    parse_cache = None
+
+
 # exported function
 def parse_program(program):
+    if parse_cache is not None:
+        ast = parse_cache.get(program)
+        if ast is not None:
+            return ast
     ast = yacc.parse(program)
     if ast is None:
         raise SyntaxError("Syntax error")
+    if parse_cache is not None:
+        parse_cache.put(program, ast)
     return ast
 
 
-# generate our parser
-yacc.yacc()
+if os.environ.get("BREWIN_PARSE_CACHE"):
+    enable_parse_cache(os.environ["BREWIN_PARSE_CACHE"])
+
+
+# generate our parser. The LALR tables are read from parsetab.py (regenerate it with
+# build_tables.py); if its signature doesn't match the grammar above they are
+# rebuilt in memory. Nothing is written to disk either way.
+yacc.yacc(debug=False, write_tables=False)
@@ -0,0 +1,43 @@
+# Regenerates the lexer and parser tables that brewlex.py and brewparse.py load at
+# import time (lextab.py and parsetab.py). Run this after changing the token rules
+# or the grammar:
+#
+#     python build_tables.py
+import os
+import sys
+import zlib
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+TABLE_MODULES = ("lextab", "parsetab")
+
+
+def build_tables():
+    for module_name in TABLE_MODULES:
+        path = os.path.join(SOURCE_DIR, module_name + ".py")
+        if os.path.exists(path):
+            os.remove(path)
+        sys.modules.pop(module_name, None)
+
+    # with the old tables gone these build everything in memory
+    import brewlex
+    import brewparse
+    from ply import lex, yacc
+
+    lex.lex(module=brewlex, optimize=True, lextab="lextab", outputdir=SOURCE_DIR)
+    with open(brewlex.__file__, "rb") as rules_file:
+        rules_crc = zlib.crc32(rules_file.read())
+    # lets brewlex.py tell whether lextab.py is out of date
+    with open(os.path.join(SOURCE_DIR, "lextab.py"), "a") as f:
+        f.write(f"rules_crc = {rules_crc}\n")
+
+    yacc.yacc(
+        module=brewparse,
+        tabmodule="parsetab",
+        outputdir=SOURCE_DIR,
+        debug=False,
+        write_tables=True,
+    )
+
+
+if __name__ == "__main__":
+    build_tables()
@@ -0,0 +1,183 @@
+# Lowers the Element AST produced by brewparse into flat bytecode for the stack VM
+# in vmv4.py. Each function or lambda body becomes a list of (opcode, arg) tuples;
+# jump targets are indexes into that list. Variable lookups carry the scope depth
+# resolverv4.py computed for them.
+from intbase import InterpreterBase
+from type_valuev4 import Type
+
+# opcodes
+LOAD_NIL = 1  # push the interpreter's shared nil value
+LOAD_LITERAL = 2  # arg: the literal's shared ConstantValue
+LOAD_NAME = 3  # arg: (variable name (may be obj.field), scope depth, inline cache)
+STORE_NAME = 4  # arg: (variable name, scope depth), pops the value to assign
+BINARY_OP = 5  # arg: operator
+UNARY_OP = 6  # arg: operator
+MAKE_CLOSURE = 7  # arg: lambda ast
+NEW_OBJECT = 8
+PREPARE_CALL = 9  # arg: (func name, # args, scope depth), push target closure and its new scope
+PREPARE_MCALL = 10  # arg: (objref, method name, # args, scope depth, inline cache), same as PREPARE_CALL
+BIND_ARG = 11  # arg: index of the formal parameter to bind the popped value to
+CALL = 12  # pop closure and scope pushed by PREPARE_CALL, push the return value
+RETURN_VALUE = 13
+RETURN_NIL = 14
+JUMP = 15  # arg: target
+JUMP_IF_FALSE = 16  # arg: (target, "if" / "while"), pops the condition
+PUSH_SCOPE = 17
+POP_SCOPE = 18
+POP_TOP = 19
+PRINT_BEGIN = 20  # push the empty string print() appends to
+PRINT_ARG = 21  # pop a value and append its printable form to the print string
+PRINT = 22  # pop the print string and output it, push nil
+INPUT = 23  # arg: (func name, # args), pops the prompt if there is one
+TRACE = 24  # arg: statement to print when trace_output is on
+LOAD_NONE = 25  # expressions the tree walker evaluates to None
+STORE_FIELD = 26  # arg: (obj.field name, scope depth), pops the value to assign
+STEP = 27  # counts a statement against the interpreter's step and time limits
+TAIL_CALL = 28  # CALL in `return f(...)`, replaces the caller's frame if that's safe
+
+LITERAL_TYPES = {
+    InterpreterBase.INT_DEF: Type.INT,
+    InterpreterBase.STRING_DEF: Type.STRING,
+    InterpreterBase.BOOL_DEF: Type.BOOL,
+}
+BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+
+
+class Compiler:
+    # count_steps emits a STEP before each statement, like the tree walker counts them
+    def __init__(self, trace_output=False, count_steps=False, tail_calls=False):
+        self.trace_output = trace_output
+        self.count_steps = count_steps
+        self.tail_calls = tail_calls
+
+    # compiles the body of a FUNC_DEF or LAMBDA_DEF node
+    def compile_function(self, func_ast):
+        code = []
+        self.__compile_block(func_ast.statements, code, func_ast.new_scope)
+        code.append((RETURN_NIL, None))
+        return code
+
+    # new_scope is False for blocks that resolverv4.py found can't create a variable
+    def __compile_block(self, statements, code, new_scope):
+        if new_scope:
+            code.append((PUSH_SCOPE, None))
+        for statement in statements:
+            self.__compile_statement(statement, code)
+        if new_scope:
+            code.append((POP_SCOPE, None))
+
+    def __compile_statement(self, statement, code):
+        if self.count_steps:
+            code.append((STEP, None))
+        if self.trace_output:
+            code.append((TRACE, statement))
+        if statement.elem_type in (InterpreterBase.FCALL_DEF, InterpreterBase.MCALL_DEF):
+            self.__compile_expr(statement, code)
+            code.append((POP_TOP, None))
+        elif statement.elem_type == "=":
+            self.__compile_expr(statement.expression, code)
+            var_name = statement.name
+            code.append(
+                (STORE_FIELD if "." in var_name else STORE_NAME, (var_name, statement.depth))
+            )
+        elif statement.elem_type == InterpreterBase.RETURN_DEF:
+            expr_ast = statement.expression
+            if expr_ast is None:
+                code.append((RETURN_NIL, None))
+            elif statement.tail_call and self.tail_calls:
+                # RETURN_VALUE only runs if TAIL_CALL couldn't replace this frame
+                self.__compile_call(expr_ast, code, TAIL_CALL)
+                code.append((RETURN_VALUE, None))
+            else:
+                self.__compile_expr(expr_ast, code)
+                code.append((RETURN_VALUE, None))
+        elif statement.elem_type == InterpreterBase.IF_DEF:
+            self.__compile_if(statement, code)
+        elif statement.elem_type == InterpreterBase.WHILE_DEF:
+            self.__compile_while(statement, code)
+        # any other expression used as a statement is never evaluated
+
+    def __compile_if(self, if_ast, code):
+        self.__compile_expr(if_ast.condition, code)
+        jump_to_else = len(code)
+        code.append(None)  # patched below
+        self.__compile_block(if_ast.statements, code, if_ast.new_scope)
+        else_statements = if_ast.else_statements
+        if else_statements is None:
+            code[jump_to_else] = (JUMP_IF_FALSE, (len(code), "if"))
+            return
+        jump_to_end = len(code)
+        code.append(None)
+        code[jump_to_else] = (JUMP_IF_FALSE, (len(code), "if"))
+        self.__compile_block(else_statements, code, if_ast.else_new_scope)
+        code[jump_to_end] = (JUMP, len(code))
+
+    def __compile_while(self, while_ast, code):
+        loop_start = len(code)
+        self.__compile_expr(while_ast.condition, code)
+        jump_to_end = len(code)
+        code.append(None)
+        self.__compile_block(while_ast.statements, code, while_ast.new_scope)
+        code.append((JUMP, loop_start))
+        code[jump_to_end] = (JUMP_IF_FALSE, (len(code), "while"))
+
+    def __compile_expr(self, expr_ast, code):
+        elem_type = expr_ast.elem_type
+        if elem_type == InterpreterBase.NIL_DEF:
+            code.append((LOAD_NIL, None))
+        elif elem_type in LITERAL_TYPES:
+            code.append((LOAD_LITERAL, expr_ast.value))
+        elif elem_type == InterpreterBase.VAR_DEF:
+            code.append((LOAD_NAME, (expr_ast.name, expr_ast.depth, expr_ast.cache)))
+        elif elem_type == InterpreterBase.FCALL_DEF:
+            self.__compile_call(expr_ast, code)
+        elif elem_type in BIN_OPS:
+            self.__compile_expr(expr_ast.op1, code)
+            self.__compile_expr(expr_ast.op2, code)
+            code.append((BINARY_OP, elem_type))
+        elif elem_type in (InterpreterBase.NEG_DEF, InterpreterBase.NOT_DEF):
+            self.__compile_expr(expr_ast.op1, code)
+            code.append((UNARY_OP, elem_type))
+        elif elem_type == InterpreterBase.LAMBDA_DEF:
+            code.append((MAKE_CLOSURE, expr_ast))
+        elif elem_type == InterpreterBase.OBJ_DEF:
+            code.append((NEW_OBJECT, None))
+        elif elem_type == InterpreterBase.MCALL_DEF:
+            args = expr_ast.args
+            code.append(
+                (
+                    PREPARE_MCALL,
+                    (expr_ast.objref, expr_ast.name, len(args), expr_ast.depth, expr_ast.cache),
+                )
+            )
+            self.__compile_args(args, code)
+            code.append((CALL, None))
+        else:
+            code.append((LOAD_NONE, None))
+
+    def __compile_call(self, call_ast, code, call_op=CALL):
+        func_name = call_ast.name
+        args = call_ast.args
+        if func_name == "print":
+            code.append((PRINT_BEGIN, None))
+            for arg in args:
+                self.__compile_expr(arg, code)
+                code.append((PRINT_ARG, None))
+            code.append((PRINT, None))
+            return
+        if func_name == "inputi":
+            # the tree walker rejects > 1 argument before evaluating any of them
+            if len(args) == 1:
+                self.__compile_expr(args[0], code)
+            code.append((INPUT, (func_name, len(args))))
+            return
+
+        code.append((PREPARE_CALL, (func_name, len(args), call_ast.depth)))
+        self.__compile_args(args, code)
+        code.append((call_op, None))
+
+    # each argument is bound right after it is evaluated, matching the tree walker
+    def __compile_args(self, args, code):
+        for index, arg in enumerate(args):
+            self.__compile_expr(arg, code)
+            code.append((BIND_ARG, index))
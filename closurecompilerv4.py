@@ -0,0 +1,432 @@
+# Compiles each FUNC_DEF / LAMBDA_DEF body into a tree of Python closures, one per
+# AST node, each of which calls the closures of its children directly. Which code
+# runs for a node is decided once, when its function is first called, instead of
+# by the elem_type checks the tree walker repeats every time it reaches the node.
+#
+# Like the VM, anything with non-trivial semantics (calls, assignment to fields,
+# operator promotion, errors) is delegated to the shared operations on
+# interpreterv4.Interpreter, so this engine behaves exactly like the tree walker.
+# Brewin calls nest Python calls here, as they do in the tree walker.
+#
+# A compiled statement returns None to go on to the next statement, or the value
+# its function returns. A compiled expression returns its Value.
+import copy
+
+from intbase import ErrorType, InterpreterBase
+from type_valuev4 import INT_OPS, Closure, Object, Type, Value, get_printable
+
+
+class ClosureCompiler:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.environment = interpreter.env.environment
+        self.body_cache = {}  # FUNC_DEF / LAMBDA_DEF ast -> compiled body
+
+    def run(self, main_ast):
+        self.__get_body(main_ast)()
+
+    def __get_body(self, func_ast):
+        body = self.body_cache.get(func_ast)
+        if body is None:
+            body = self.__compile_block(func_ast.statements, func_ast.new_scope)
+            self.body_cache[func_ast] = body
+        return body
+
+    # same as Interpreter.__invoke. A body returns a (closure, call scope) pair for a
+    # tail call that can run after the body's own scopes are gone.
+    def __invoke(self, target_closure, new_env):
+        interpreter = self.interpreter
+        memo_key = interpreter.memo_key(target_closure, new_env)
+        if memo_key is not None:
+            return_val = interpreter.memo.get(memo_key)
+            if return_val is not None:
+                return return_val
+        environment = self.environment
+        caller_frame_base = interpreter.frame_base
+        interpreter.frame_base = len(environment)
+        interpreter.enter_call()
+        while True:
+            environment.append(new_env)
+            return_val = self.__get_body(target_closure.func_ast)()
+            environment.pop()
+            if type(return_val) is not tuple:
+                break
+            target_closure, new_env = return_val
+        interpreter.call_depth -= 1
+        interpreter.frame_base = caller_frame_base
+        if return_val is None:
+            return_val = interpreter.NIL_VALUE
+        if memo_key is not None:
+            interpreter.memo_store(memo_key, return_val)
+        return return_val
+
+    # new_scope is False for blocks that resolverv4.py found can't create a variable
+    def __compile_block(self, statements, new_scope):
+        environment = self.environment
+        compiled = tuple(self.__compile_statement(statement) for statement in statements)
+        if not new_scope:
+
+            def run_unscoped_block():
+                for statement in compiled:
+                    return_val = statement()
+                    if return_val is not None:
+                        return return_val
+                return None
+
+            return run_unscoped_block
+
+        def run_block():
+            environment.append({})
+            for statement in compiled:
+                return_val = statement()
+                if return_val is not None:
+                    environment.pop()
+                    return return_val
+            environment.pop()
+            return None
+
+        return run_block
+
+    def __compile_statement(self, statement):
+        elem_type = statement.elem_type
+        if elem_type in (InterpreterBase.FCALL_DEF, InterpreterBase.MCALL_DEF):
+            run = self.__compile_call_statement(statement)
+        elif elem_type == "=":
+            run = self.__compile_assign(statement)
+        elif elem_type == InterpreterBase.RETURN_DEF:
+            run = self.__compile_return(statement)
+        elif elem_type == InterpreterBase.IF_DEF:
+            run = self.__compile_if(statement)
+        elif elem_type == InterpreterBase.WHILE_DEF:
+            run = self.__compile_while(statement)
+        else:
+            # any other expression used as a statement is never evaluated
+            def run():
+                return None
+
+        interpreter = self.interpreter
+        if interpreter.trace_output:
+            traced = run
+
+            def run():
+                print(statement)
+                return traced()
+
+        if interpreter.count_steps:
+            counted = run
+
+            def run():
+                interpreter.steps += 1
+                if interpreter.steps >= interpreter.check_at:
+                    interpreter.check_limits()
+                return counted()
+
+        return run
+
+    def __compile_call_statement(self, call_ast):
+        call = self.__compile_expr(call_ast)
+
+        def run_call():
+            call()
+
+        return run_call
+
+    def __compile_assign(self, assign_ast):
+        interpreter = self.interpreter
+        var_name = assign_ast.name
+        depth = assign_ast.depth
+        expr = self.__compile_expr(assign_ast.expression)
+        if "." in var_name:
+
+            def run_assign_field():
+                interpreter.assign_value(var_name, expr(), depth)
+
+            return run_assign_field
+
+        environment = self.environment
+        get_at = interpreter.env.get_at
+        CLOSURE = Type.CLOSURE
+
+        # same as Interpreter.assign_value for a plain variable name
+        def run_assign():
+            value_obj = expr()
+            scope = environment[-1 - depth]
+            if var_name in scope:
+                target_value_obj = scope[var_name]
+            else:
+                target_value_obj = get_at(var_name, depth + 1)
+            if target_value_obj is None:
+                environment[-1][var_name] = copy.copy(value_obj)
+            elif target_value_obj.t == CLOSURE and value_obj.t != CLOSURE:
+                target_value_obj.v.type = value_obj.t
+            else:
+                target_value_obj.set(value_obj)
+
+        return run_assign
+
+    def __compile_return(self, return_ast):
+        interpreter = self.interpreter
+        expr_ast = return_ast.expression
+        if expr_ast is None:
+            nil_value = interpreter.NIL_VALUE
+
+            def run_return_nil():
+                return nil_value
+
+            return run_return_nil
+
+        return_value = interpreter.return_value
+        expr = self.__compile_expr(expr_ast)
+        if not (return_ast.tail_call and interpreter.tail_calls):
+
+            def run_return():
+                return return_value(expr())
+
+            return run_return
+
+        environment = self.environment
+        prepare_call = self.__compile_prepare_call(expr_ast)
+        invoke = self.__invoke
+
+        # same as the tail call path of Interpreter.__do_return
+        def run_tail_call():
+            if interpreter.frame_base is None:
+                return return_value(expr())
+            target_closure, new_env = prepare_call()
+            scopes = environment[interpreter.frame_base:]
+            if interpreter.can_drop_frames(target_closure, scopes):
+                return (target_closure, new_env)
+            return return_value(invoke(target_closure, new_env))
+
+        return run_tail_call
+
+    def __compile_if(self, if_ast):
+        condition = self.__compile_expr(if_ast.condition)
+        check_condition = self.interpreter.check_condition
+        then_block = self.__compile_block(if_ast.statements, if_ast.new_scope)
+        else_block = None
+        if if_ast.else_statements is not None:
+            else_block = self.__compile_block(
+                if_ast.else_statements, if_ast.else_new_scope
+            )
+        BOOL = Type.BOOL
+
+        def run_if():
+            cond = condition()
+            if cond.t == BOOL:
+                run_then = cond.v
+            else:
+                run_then = check_condition(cond, "if")
+            if run_then:
+                return then_block()
+            if else_block is not None:
+                return else_block()
+            return None
+
+        return run_if
+
+    def __compile_while(self, while_ast):
+        condition = self.__compile_expr(while_ast.condition)
+        check_condition = self.interpreter.check_condition
+        body = self.__compile_block(while_ast.statements, while_ast.new_scope)
+        BOOL = Type.BOOL
+
+        def run_while():
+            while True:
+                cond = condition()
+                if cond.t == BOOL:
+                    run_body = cond.v
+                else:
+                    run_body = check_condition(cond, "while")
+                if not run_body:
+                    return None
+                return_val = body()
+                if return_val is not None:
+                    return return_val
+
+        return run_while
+
+    def __compile_expr(self, expr_ast):
+        interpreter = self.interpreter
+        elem_type = expr_ast.elem_type
+        if elem_type == InterpreterBase.NIL_DEF:
+            return self.__constant(interpreter.NIL_VALUE)
+        if elem_type in (
+            InterpreterBase.INT_DEF, InterpreterBase.STRING_DEF, InterpreterBase.BOOL_DEF
+        ):
+            return self.__constant(expr_ast.value)
+        if elem_type == InterpreterBase.VAR_DEF:
+            return self.__compile_var(expr_ast)
+        if elem_type == InterpreterBase.FCALL_DEF:
+            return self.__compile_fcall(expr_ast)
+        if elem_type in interpreter.BIN_OPS:
+            return self.__compile_bin_op(expr_ast)
+        if elem_type in (InterpreterBase.NEG_DEF, InterpreterBase.NOT_DEF):
+            op1 = self.__compile_expr(expr_ast.op1)
+            eval_unary_op = interpreter.eval_unary_op
+
+            def unary_op():
+                return eval_unary_op(elem_type, op1())
+
+            return unary_op
+        if elem_type == InterpreterBase.LAMBDA_DEF:
+            env = interpreter.env
+
+            def make_closure():
+                return Value(Type.CLOSURE, Closure(expr_ast, env))
+
+            return make_closure
+        if elem_type == InterpreterBase.OBJ_DEF:
+
+            def new_object():
+                return Value(Type.OBJECT, Object())
+
+            return new_object
+        if elem_type == InterpreterBase.MCALL_DEF:
+            return self.__compile_mcall(expr_ast)
+        return self.__constant(None)
+
+    @staticmethod
+    def __constant(value_obj):
+        def constant():
+            return value_obj
+
+        return constant
+
+    def __compile_var(self, var_ast):
+        var_name = var_ast.name
+        depth = var_ast.depth
+        cache = var_ast.cache
+        eval_name = self.interpreter.eval_name
+        if "." in var_name:
+
+            def load_member():
+                return eval_name(var_name, depth, cache)
+
+            return load_member
+
+        environment = self.environment
+
+        def load_name():
+            scope = environment[-1 - depth]
+            if var_name in scope:
+                return scope[var_name]
+            return eval_name(var_name, depth, cache)
+
+        return load_name
+
+    def __compile_bin_op(self, bin_op_ast):
+        oper = bin_op_ast.elem_type
+        op1 = self.__compile_expr(bin_op_ast.op1)
+        op2 = self.__compile_expr(bin_op_ast.op2)
+        eval_bin_op = self.interpreter.eval_bin_op
+        int_op = INT_OPS.get(oper)
+        if int_op is None:
+
+            def bin_op():
+                return eval_bin_op(oper, op1(), op2())
+
+            return bin_op
+
+        make_value, operation = int_op
+        INT = Type.INT
+
+        def int_bin_op():
+            left_value_obj = op1()
+            right_value_obj = op2()
+            if left_value_obj.t == INT and right_value_obj.t == INT:
+                return make_value(operation(left_value_obj.v, right_value_obj.v))
+            return eval_bin_op(oper, left_value_obj, right_value_obj)
+
+        return int_bin_op
+
+    def __compile_fcall(self, call_ast):
+        if call_ast.name == "print":
+            return self.__compile_print(call_ast)
+        if call_ast.name == "inputi":
+            return self.__compile_input(call_ast)
+        prepare_call = self.__compile_prepare_call(call_ast)
+        invoke = self.__invoke
+
+        def call():
+            return invoke(*prepare_call())
+
+        return call
+
+    # returns a function giving the closure call_ast calls and its call scope, with
+    # the args bound
+    def __compile_prepare_call(self, call_ast):
+        interpreter = self.interpreter
+        func_name = call_ast.name
+        depth = call_ast.depth
+        num_args = len(call_ast.args)
+        bind_args = self.__compile_args(call_ast.args)
+
+        def prepare_call():
+            target_closure = interpreter.get_callable(func_name, num_args, depth)
+            new_env = interpreter.new_call_env(target_closure, num_args)
+            bind_args(target_closure, new_env)
+            return target_closure, new_env
+
+        return prepare_call
+
+    def __compile_mcall(self, call_ast):
+        interpreter = self.interpreter
+        objref = call_ast.objref
+        func_name = call_ast.name
+        depth = call_ast.depth
+        cache = call_ast.cache
+        num_args = len(call_ast.args)
+        bind_args = self.__compile_args(call_ast.args)
+        invoke = self.__invoke
+
+        def mcall():
+            obj, target_closure = interpreter.get_method(objref, func_name, depth, cache)
+            new_env = interpreter.new_call_env(target_closure, num_args, obj)
+            bind_args(target_closure, new_env)
+            return invoke(target_closure, new_env)
+
+        return mcall
+
+    # each argument is bound right after it is evaluated, matching the tree walker
+    def __compile_args(self, args):
+        bind_arg = self.interpreter.bind_arg
+        compiled = tuple(self.__compile_expr(arg) for arg in args)
+
+        def bind_args(target_closure, new_env):
+            for formal_ast, arg in zip(target_closure.func_ast.args, compiled):
+                bind_arg(formal_ast, arg(), new_env)
+
+        return bind_args
+
+    def __compile_print(self, call_ast):
+        interpreter = self.interpreter
+        compiled = tuple(self.__compile_expr(arg) for arg in call_ast.args)
+        nil_value = interpreter.NIL_VALUE
+
+        def call_print():
+            output = ""
+            for arg in compiled:
+                output = output + get_printable(arg())
+            interpreter.output(output)
+            return nil_value
+
+        return call_print
+
+    # same as Interpreter.__call_input
+    def __compile_input(self, call_ast):
+        interpreter = self.interpreter
+        func_name = call_ast.name
+        args = call_ast.args
+        prompt = self.__compile_expr(args[0]) if len(args) == 1 else None
+
+        def call_input():
+            if prompt is not None:
+                interpreter.output(get_printable(prompt()))
+            elif len(args) > 1:
+                interpreter.error(
+                    ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
+                )
+            return interpreter.read_input(func_name)
+
+        return call_input
@@ -1,23 +1,20 @@
-class Element:
-    def __init__(self, elem_type, **kwargs):
-        self.elem_type = elem_type
-        self.dict = {}
-        for key, value in kwargs.items():
-            self.dict[key] = value
+from intbase import InterpreterBase
 
-    def get(self, key):
-        if key not in self.dict:
-            return None
-        return self.dict[key]
+
+# What every AST node has, whichever way it stores its fields: get(key), items()
+# and the printed form trace_output shows. It has no slots of its own, so the
+# slotted Node types below only carry the fields they declare.
+class ElementBase:
+    __slots__ = ()
 
     def __str__(self):
         s = f"{self.elem_type}: "
-        for key, value in self.dict.items():
+        for key, value in self.items():
             s += key + ": " + self.__val(value) + ", "
         return s[0:-2]
 
     def __val(self, v):
-        if isinstance(v, Element):
+        if isinstance(v, ElementBase):
             return "[" + str(v) + "]"
         if isinstance(v, list):
             s = ""
@@ -27,3 +24,257 @@ class Element:
                 return "[" + s[0:-2] + "]"
             return "[" + s + "]"
         return str(v)
+
+
+# An AST node that keeps its fields in a dict, as every node did before the typed
+# Node classes below
+class Element(ElementBase):
+    __slots__ = ("elem_type", "dict")
+
+    def __init__(self, elem_type, **kwargs):
+        self.elem_type = elem_type
+        self.dict = {}
+        for key, value in kwargs.items():
+            self.dict[key] = value
+
+    def get(self, key):
+        if key not in self.dict:
+            return None
+        return self.dict[key]
+
+    def items(self):
+        return self.dict.items()
+
+
+# Typed AST nodes built by brewparse. Each node type keeps its fields in slots
+# instead of a per-instance dict, so they are read directly (e.g. if_ast.condition).
+# get(key) still works for code written against the dict-backed Element.
+class Node(ElementBase):
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.FIELDS, values):
+            setattr(self, field, value)
+
+    def get(self, key):
+        if key not in self.FIELDS:
+            return None
+        return getattr(self, key)
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.FIELDS]
+
+    # elem_type is a class attribute on most node types, so rebuild nodes (for
+    # pickle and copy) from their fields rather than from their slots
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, field) for field in self.FIELDS))
+
+    # nodes are never changed once the program has been parsed and resolved, so
+    # copies of values that hold them (e.g. closures) can share them
+    def __deepcopy__(self, memo):
+        return self
+
+
+class Program(Node):
+    __slots__ = FIELDS = ("functions",)
+    elem_type = InterpreterBase.PROGRAM_DEF
+
+
+# FuncDef and LambdaDef also hold the names a closure over them captures and the
+# names a call to them might look up in the caller's scopes, as computed by
+# resolverv4.py (None for every visible variable). FuncDef also holds whether the
+# function is pure, i.e. whether its result can be memoized.
+#
+# new_scope on the nodes that hold a block of statements says whether running the
+# block needs a scope of its own. resolverv4.py clears it for blocks that can't
+# create a variable, which then run in the enclosing scope.
+class FuncDef(Node):
+    __slots__ = (
+        "name",
+        "args",
+        "statements",
+        "captures",
+        "external_names",
+        "new_scope",
+        "pure",
+        "memo_names",
+    )
+    FIELDS = ("name", "args", "statements")
+    elem_type = InterpreterBase.FUNC_DEF
+
+    def __init__(self, name, args, statements):
+        self.name = name
+        self.args = args
+        self.statements = statements
+        self.captures = None
+        self.external_names = None
+        self.new_scope = True
+        self.pure = False
+        self.memo_names = None
+
+
+class LambdaDef(Node):
+    __slots__ = ("args", "statements", "captures", "external_names", "new_scope")
+    FIELDS = ("args", "statements")
+    elem_type = InterpreterBase.LAMBDA_DEF
+
+    def __init__(self, args, statements):
+        self.args = args
+        self.statements = statements
+        self.captures = None
+        self.external_names = None
+        self.new_scope = True
+
+
+class Arg(Node):
+    __slots__ = FIELDS = ("name",)
+    elem_type = InterpreterBase.ARG_DEF
+
+
+class RefArg(Node):
+    __slots__ = FIELDS = ("name",)
+    elem_type = InterpreterBase.REFARG_DEF
+
+
+# Assign, Var, FCall and MCall also hold the scope depth resolverv4.py computes
+# for the variable they look up (see EnvironmentManager.get_at). Var and MCall
+# hold the inline cache for their member lookup too, if they do one.
+class Assign(Node):
+    __slots__ = ("name", "expression", "depth")
+    FIELDS = ("name", "expression")
+    elem_type = "="
+
+    def __init__(self, name, expression):
+        self.name = name
+        self.expression = expression
+        self.depth = 0
+
+
+class If(Node):
+    __slots__ = ("condition", "statements", "else_statements", "new_scope", "else_new_scope")
+    FIELDS = ("condition", "statements", "else_statements")
+    elem_type = InterpreterBase.IF_DEF
+
+    def __init__(self, condition, statements, else_statements):
+        self.condition = condition
+        self.statements = statements
+        self.else_statements = else_statements
+        self.new_scope = True
+        self.else_new_scope = True
+
+
+class While(Node):
+    __slots__ = ("condition", "statements", "new_scope")
+    FIELDS = ("condition", "statements")
+    elem_type = InterpreterBase.WHILE_DEF
+
+    def __init__(self, condition, statements):
+        self.condition = condition
+        self.statements = statements
+        self.new_scope = True
+
+
+# tail_call is set by resolverv4.py if the returned expression is a function call
+class Return(Node):
+    __slots__ = ("expression", "tail_call")
+    FIELDS = ("expression",)
+    elem_type = InterpreterBase.RETURN_DEF
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tail_call = False
+
+
+class Not(Node):
+    __slots__ = FIELDS = ("op1",)
+    elem_type = InterpreterBase.NOT_DEF
+
+
+class Neg(Node):
+    __slots__ = FIELDS = ("op1",)
+    elem_type = InterpreterBase.NEG_DEF
+
+
+# arithmetic, comparison and logical operators; elem_type is the operator
+class BinOp(Node):
+    __slots__ = ("elem_type", "op1", "op2")
+    FIELDS = ("op1", "op2")
+
+    def __init__(self, elem_type, op1, op2):
+        self.elem_type = elem_type
+        self.op1 = op1
+        self.op2 = op2
+
+    def __reduce__(self):
+        return (BinOp, (self.elem_type, self.op1, self.op2))
+
+
+# literals also hold the Value they evaluate to, which resolverv4.py builds once
+class Literal(Node):
+    __slots__ = ("val", "value")
+    FIELDS = ("val",)
+
+    def __init__(self, val):
+        self.val = val
+        self.value = None
+
+
+class IntLiteral(Literal):
+    __slots__ = ()
+    elem_type = InterpreterBase.INT_DEF
+
+
+class StringLiteral(Literal):
+    __slots__ = ()
+    elem_type = InterpreterBase.STRING_DEF
+
+
+class BoolLiteral(Literal):
+    __slots__ = ()
+    elem_type = InterpreterBase.BOOL_DEF
+
+
+class Nil(Node):
+    __slots__ = ()
+    elem_type = InterpreterBase.NIL_DEF
+
+
+class NewObject(Node):
+    __slots__ = ()
+    elem_type = InterpreterBase.OBJ_DEF
+
+
+class Var(Node):
+    __slots__ = ("name", "depth", "cache")
+    FIELDS = ("name",)
+    elem_type = InterpreterBase.VAR_DEF
+
+    def __init__(self, name):
+        self.name = name
+        self.depth = 0
+        self.cache = None
+
+
+class FCall(Node):
+    __slots__ = ("name", "args", "depth")
+    FIELDS = ("name", "args")
+    elem_type = InterpreterBase.FCALL_DEF
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.depth = 0
+
+
+class MCall(Node):
+    __slots__ = ("objref", "name", "args", "depth", "cache")
+    FIELDS = ("objref", "name", "args")
+    elem_type = InterpreterBase.MCALL_DEF
+
+    def __init__(self, objref, name, args):
+        self.objref = objref
+        self.name = name
+        self.args = args
+        self.depth = 0
+        self.cache = None
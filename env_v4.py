@@ -12,6 +12,17 @@ class EnvironmentManager:
 
         return None
 
+    # same as get, for a reference resolverv4.py has shown can't be bound in any of
+    # the top `depth` scopes, so the search starts at that scope (0 = innermost)
+    def get_at(self, symbol, depth):
+        environment = self.environment
+        for index in range(len(environment) - 1 - depth, -1, -1):
+            env = environment[index]
+            if symbol in env:
+                return env[symbol]
+
+        return None
+
     def set(self, symbol, value, force_new_var_creation=False):
         if force_new_var_creation:
             self.environment[-1][symbol] = value
@@ -0,0 +1,145 @@
+# Fork server for running single Brewin programs with almost no startup cost. The
+# server imports brewparse and every interpreter version once, runs a tiny program
+# on each so everything they set up lazily is ready too, and then forks a child
+# per request; the child starts with all of that already in memory, runs the
+# program and exits, so one run can't leave anything behind for the next.
+#
+#     python fork_server.py serve SOCKET
+#     python fork_server.py run SOCKET PROGRAM.br [--inputs FILE] [--version N]
+#                                                 [--engine ENGINE] [--timeout S]
+#
+# Requests and responses are single JSON lines over a Unix socket, one request
+# per connection. A request has the program's "source" and optionally "inputs",
+# "version" (default 4), "engine" and "timeout" (seconds); the response is the
+# same result batch_runner.py gives for a job: "status", "output", "error_type",
+# "error_line" and "seconds".
+import argparse
+import gc
+import importlib
+import json
+import os
+import signal
+import socket
+import sys
+
+import batch_runner
+
+WARM_UP_PROGRAM = "func main() { print(1); }"
+
+
+def warm_up():
+    for version in batch_runner.VERSIONS:
+        interpreter_class = importlib.import_module(f"interpreterv{version}").Interpreter
+        interpreter_class(console_output=False).run(WARM_UP_PROGRAM)
+    # everything allocated so far lives as long as the server; keeping it out of
+    # the collector's reach means children don't copy those pages just to scan them
+    gc.freeze()
+
+
+def serve(socket_path, backlog=64):
+    warm_up()
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(backlog)
+    # children are reaped by the kernel; nothing waits for them
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # let a plain kill go through the finally below, which removes the socket
+    signal.signal(signal.SIGTERM, stop_server)
+    try:
+        while True:
+            try:
+                connection, _ = server.accept()
+            except InterruptedError:
+                continue
+            if os.fork() == 0:
+                server.close()
+                handle_request(connection)
+            connection.close()
+    finally:
+        server.close()
+        os.unlink(socket_path)
+
+
+def stop_server(signum, frame):
+    sys.exit(0)
+
+
+# runs in the forked child, and never returns
+def handle_request(connection):
+    status = 0
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        with connection.makefile("rwb") as stream:
+            try:
+                request = json.loads(stream.readline())
+                result = run_request(request)
+            except Exception as e:
+                result = {"status": "crash", "message": f"{type(e).__name__}: {e}"}
+            stream.write(json.dumps(result).encode() + b"\n")
+    except BaseException:
+        status = 1
+    finally:
+        # skip the interpreter's shutdown; the parent still owns everything else
+        os._exit(status)
+
+
+def run_request(request):
+    version = request.get("version", 4)
+    engine = request.get("engine")
+    timeout = request.get("timeout")
+    batch_runner.check_options(version, engine, timeout)
+    batch_runner.init_worker(version, engine)
+    job = {"id": request.get("id"), "source": request["source"]}
+    job["inputs"] = request.get("inputs", [])
+    return batch_runner.run_job(job, timeout)
+
+
+# sends one program to the server at socket_path and returns its result
+def run(socket_path, source, inputs=None, version=4, engine=None, timeout=None):
+    request = {"source": source, "inputs": inputs or [], "version": version}
+    if engine is not None:
+        request["engine"] = engine
+    if timeout is not None:
+        request["timeout"] = timeout
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        with client.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            response = stream.readline()
+    if not response:
+        raise ConnectionError("fork server closed the connection without a result")
+    return json.loads(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fork server for Brewin programs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="start the server")
+    serve_parser.add_argument("socket")
+    run_parser = commands.add_parser("run", help="run a program on a running server")
+    run_parser.add_argument("socket")
+    run_parser.add_argument("program")
+    run_parser.add_argument("--inputs", default=None, help="file with one input per line")
+    run_parser.add_argument("--version", type=int, default=4, choices=batch_runner.VERSIONS)
+    run_parser.add_argument("--engine", default=None, help="v4 execution engine")
+    run_parser.add_argument("--timeout", type=float, default=None, help="seconds")
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.socket)
+        return
+    with open(args.program) as f:
+        source = f.read()
+    inputs = []
+    if args.inputs is not None:
+        with open(args.inputs) as f:
+            inputs = f.read().splitlines()
+    result = run(args.socket, source, inputs, args.version, args.engine, args.timeout)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Sources for the values a Brewin program reads with inputi/inputs. InterpreterBase
+# reads them through an input provider (see its inp argument): a list of values
+# is read from a ListInput and no inp at all from the keyboard, and any of the
+# providers below can be passed in its place.
+#
+# A provider has read(), which returns the next value, without its newline, or
+# None once there are no more, and interactive, which is True if reading can
+# wait on a person (so any output the program has buffered is flushed first).
+# The streaming providers hold only a batch of lines at a time, so a program can
+# read any number of them in constant memory. Providers that own a file also have
+# close(), and work as context managers.
+import mmap
+import sys
+
+
+# reads each value with input(), which is what the interpreters always did when
+# given no inputs
+class KeyboardInput:
+    interactive = True
+
+    def read(self):
+        return input()
+
+
+class ListInput:
+    interactive = False
+
+    def __init__(self, values):
+        self.values = values
+        self.cursor = 0
+
+    def read(self):
+        if self.cursor < len(self.values):
+            value = self.values[self.cursor]
+            self.cursor += 1
+            return value
+        return None
+
+
+# reads lines from a text stream (sys.stdin when it's None, looked up when lines
+# are read, so redirecting sys.stdin works) about batch_size bytes at a time, for
+# a file or a pipe; a terminal waits for a whole batch, so use KeyboardInput there
+class StreamInput:
+    interactive = False
+
+    def __init__(self, stream=None, batch_size=64 * 1024):
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        self.stream = stream
+        self.batch_size = batch_size
+        self.batch = []
+        self.index = 0
+
+    def read(self):
+        if self.index == len(self.batch):
+            stream = sys.stdin if self.stream is None else self.stream
+            self.batch = stream.readlines(self.batch_size)
+            self.index = 0
+            if not self.batch:
+                return None
+        line = self.batch[self.index]
+        self.index += 1
+        if line.endswith("\n"):
+            return line[:-1]
+        return line
+
+
+# StreamInput reading a file it opens, from a path or a file descriptor (e.g. a
+# pipe's read end), and closes on close()
+class FileInput(StreamInput):
+    def __init__(self, file, batch_size=64 * 1024, encoding=None):
+        super().__init__(open(file, encoding=encoding), batch_size)
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# reads the lines of a file through a memory map, finding each line only when
+# it's read and decoding nothing else; the OS pages the file in and out as needed
+class MmapInput:
+    interactive = False
+
+    def __init__(self, path, encoding="utf-8"):
+        self.encoding = encoding
+        self.position = 0
+        with open(path, "rb") as f:
+            f.seek(0, 2)
+            self.size = f.tell()
+            # an empty file can't be mapped, and has nothing to read anyway
+            self.map = None
+            if self.size:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self):
+        if self.position >= self.size:
+            return None
+        end = self.map.find(b"\n", self.position)
+        if end < 0:
+            end = self.size
+        line = self.map[self.position:end]
+        self.position = end + 1
+        return line.decode(self.encoding)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,11 +1,15 @@
 # Base class for our interpreter
 from enum import Enum
 
+from input_providers import KeyboardInput, ListInput
+from output_sinks import CaptureSink, PrintSink, RingBufferSink
+
 
 class ErrorType(Enum):
     TYPE_ERROR = 1
     NAME_ERROR = 2  # if a variable or function name can't be found
     FAULT_ERROR = 3  # used if an object reference is null and used to make a call
+    RESOURCE_ERROR = 4  # used if a program runs past its step, call depth or time limit
     # Add others here
 
 
@@ -34,15 +38,43 @@ class InterpreterBase:
     NOT_DEF = "!"
 
     # methods
-    def __init__(self, console_output=True, inp=None):
+    # inp says where inputi/inputs read from: a list of values, the keyboard if it's
+    # None, or a provider from input_providers.py (e.g. a FileInput).
+    # console_output says where printed lines are shown: True prints each one, False
+    # drops them, or it can be a sink from output_sinks.py (e.g. a BufferedSink).
+    # capture_output says which of them get_output returns: True keeps them all, a
+    # number keeps only that many of the latest ones, False keeps none, or it can be
+    # a sink with a lines() method.
+    def __init__(self, console_output=True, inp=None, capture_output=True):
         self.console_output = console_output
-        self.inp = inp  # if not none, then read input from passed-in list
+        self.inp = inp  # if not none, then read input from passed-in list or provider
+        if console_output is True:
+            self.console_sink = PrintSink()
+        elif console_output is False or console_output is None:
+            self.console_sink = None
+        else:
+            self.console_sink = console_output
+        if capture_output is True:
+            self.capture_sink = CaptureSink()
+        elif capture_output is False or capture_output is None:
+            self.capture_sink = None
+        elif isinstance(capture_output, int):
+            self.capture_sink = RingBufferSink(capture_output)
+        else:
+            self.capture_sink = capture_output
         self.reset()
 
     # Call to reset I/O for another run of the program
     def reset(self):
-        self.output_log = []
-        self.input_cursor = 0
+        if self.capture_sink is not None:
+            self.capture_sink.clear()
+        # a list is read from the start again; a provider carries on where it was
+        if self.inp is None:
+            self.input_provider = KeyboardInput()
+        elif hasattr(self.inp, "read"):
+            self.input_provider = self.inp
+        else:
+            self.input_provider = ListInput(self.inp)
         self.error_type = None
         self.error_line = None
 
@@ -50,15 +82,11 @@ class InterpreterBase:
     def run(self, program):
         pass
 
+    # returns None once a list or provider has no more inputs
     def get_input(self):
-        if not self.inp:
-            return input()  # Get input from keyboard if not input list provided
-
-        if self.input_cursor < len(self.inp):
-            cur_input = self.inp[self.input_cursor]
-            self.input_cursor += 1
-            return cur_input
-        return None
+        if self.input_provider.interactive:
+            self.flush_output()  # so a prompt printed before this is shown
+        return self.input_provider.read()
 
     # students must call this for any errors that they run into
     def error(self, error_type, description=None, line_num=None):
@@ -75,12 +103,26 @@ class InterpreterBase:
         raise Exception(f"{error_type} on line {line_num}{description}")
 
     def output(self, v):
-        if self.console_output:
-            print(v)
-        self.output_log.append(v)
+        if self.console_sink is not None:
+            self.console_sink.write(v)
+        if self.capture_sink is not None:
+            self.capture_sink.write(v)
+
+    # writes out any lines the sinks are holding back; run calls this when it ends
+    def flush_output(self):
+        if self.console_sink is not None:
+            self.console_sink.flush()
+        if self.capture_sink is not None:
+            self.capture_sink.flush()
 
     def get_output(self):
-        return self.output_log
+        if self.capture_sink is None:
+            return []
+        return self.capture_sink.lines()
+
+    @property
+    def output_log(self):
+        return self.get_output()
 
     def get_error_type_and_line(self):
         return self.error_type, self.error_line
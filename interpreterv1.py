@@ -16,10 +16,13 @@ class Interpreter(InterpreterBase):
 
     def run(self, program):
         #print("run starting")
-        ast = parse_program(program)         # parse program into AST
-        self.var_map = dict() # dict to hold variables
-        main_func_node = ast.get('functions')
-        self.run_func(main_func_node)
+        try:
+            ast = parse_program(program)         # parse program into AST
+            self.var_map = dict() # dict to hold variables
+            main_func_node = ast.get('functions')
+            self.run_func(main_func_node)
+        finally:
+            super().flush_output()  # write out lines a buffering console sink holds
 
 # 	func run_func(func_node):
 # 		for each statement_node in func_node.statements:
@@ -22,12 +22,15 @@ class Interpreter(InterpreterBase):
     # usese the provided Parser found in brewparse.py to parse the program
     # into an abstract syntax tree (ast)
     def run(self, program):
-        ast = parse_program(program)
-        self.__set_up_function_table(ast)
-        main_func = self.__get_func_by_name("main", 0)
-        self.env = EnvironmentManager()
-        self.env_stack = EnvironmentStack(self.env)
-        self.__run_statements(main_func.get("statements"))
+        try:
+            ast = parse_program(program)
+            self.__set_up_function_table(ast)
+            main_func = self.__get_func_by_name("main", 0)
+            self.env = EnvironmentManager()
+            self.env_stack = EnvironmentStack(self.env)
+            self.__run_statements(main_func.get("statements"))
+        finally:
+            super().flush_output()  # write out lines a buffering console sink holds
 
     def __set_up_function_table(self, ast):
         self.func_name_to_ast = {}
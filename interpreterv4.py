@@ -1,10 +1,30 @@
 import copy
+import math
+import time
 from enum import Enum
 
 from brewparse import parse_program
+from closurecompilerv4 import ClosureCompiler
 from env_v4 import EnvironmentManager
 from intbase import InterpreterBase, ErrorType
-from type_valuev4 import Object, Closure, Type, Value, create_value, get_printable
+from memov4 import DEFAULT_MAX_ENTRIES, MemoCache
+from optimizerv4 import Optimizer
+from resolverv4 import Resolver
+from transpilerv4 import CODE_CACHE, Transpiler, cache_key, cache_program
+from type_valuev4 import (
+    INT_OPS,
+    TRUE,
+    Closure,
+    ConstantValue,
+    Object,
+    Type,
+    Value,
+    bool_value,
+    create_value,
+    get_printable,
+    int_value,
+)
+from vmv4 import VirtualMachine
 
 
 class ExecStatus(Enum):
@@ -12,44 +32,215 @@ class ExecStatus(Enum):
     RETURN = 2
 
 
+# returned as the value of a function whose tail call can run after the function's
+# own scopes are gone, so it runs in their place instead of on top of them
+class TailCall:
+    def __init__(self, target_closure, new_env):
+        self.target_closure = target_closure
+        self.new_env = new_env
+
+
+# A program that Interpreter.prepare has parsed and resolved, which Interpreter.run
+# can then run any number of times. Runs share its AST and function table, and the
+# vm engine's bytecode and python engine's translation; the inline caches runs leave on the AST stay valid for later
+# runs, since they are checked against the objects they are used on.
+class CompiledProgram:
+    def __init__(self, ast):
+        self.ast = ast
+        self.functions = {}  # name -> {number of params -> Closure}
+        empty_env = EnvironmentManager()
+        for func_def in ast.functions:
+            overloads = self.functions.setdefault(func_def.name, {})
+            overloads[len(func_def.args)] = Closure(func_def, empty_env)
+        self.vm_code = {}  # compiler options -> {func ast -> bytecode}
+        # code generation options -> python engine's translation (see transpilerv4.py)
+        self.python_code = {}
+
+    # the function table for one run. Assigning a non-closure to a variable that
+    # holds a function changes the function's Closure (see Interpreter.assign_value),
+    # so each run gets its own copies; all they have of their own is that type
+    def function_table(self):
+        return {
+            name: {
+                num_params: copy.copy(closure)
+                for num_params, closure in overloads.items()
+            }
+            for name, overloads in self.functions.items()
+        }
+
+    def vm_code_cache(self, trace_output, count_steps, tail_calls):
+        return self.vm_code.setdefault((trace_output, count_steps, tail_calls), {})
+
+
 # Main interpreter class
 class Interpreter(InterpreterBase):
     # constants
-    NIL_VALUE = create_value(InterpreterBase.NIL_DEF)
-    TRUE_VALUE = create_value(InterpreterBase.TRUE_DEF)
+    NIL_VALUE = ConstantValue.of(create_value(InterpreterBase.NIL_DEF))
+    TRUE_VALUE = TRUE
     BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+    ENGINES = {"tree", "vm", "closure", "python"}
+    TIME_CHECK_INTERVAL = 1000  # statements run between checks of the clock
+    MEMO_TYPES = {Type.INT, Type.STRING, Type.BOOL, Type.NIL}  # memoizable args/results
 
     # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
-        super().__init__(console_output, inp)
+    # engine selects how programs are executed: "tree" walks the AST directly,
+    # "vm" compiles each function to bytecode and runs it on the stack VM in vmv4.py,
+    # which keeps Brewin call frames off the Python stack so deep recursion works,
+    # "closure" compiles each function to nested Python closures (see
+    # closurecompilerv4.py) and "python" translates the program to Python source
+    # and runs that (see transpilerv4.py); cache_code has the python engine reuse
+    # the parsed, resolved and translated program across runs of the same source
+    # max_steps caps the number of statements run, max_call_depth the number of
+    # nested function calls and time_limit the seconds a run may take; going past
+    # any of them is a RESOURCE_ERROR. None means no limit.
+    # tail_calls=False turns off reusing the caller's frame for `return f(...)`,
+    # so every call shows up in Python tracebacks and counts towards max_call_depth.
+    # optimize folds constant expressions before running (see optimizerv4.py), and
+    # dump_ast prints the program's AST, after optimizing it, before it runs.
+    # memoize caches the results of calls to pure functions (see memo_key), keeping
+    # up to memo_size of them; self.memo.stats() has the cache's hit/miss counts.
+    # Calls answered from the cache don't run, so they count no steps and aren't
+    # traced.
+    # console_output and capture_output choose where printed lines go and which of
+    # them get_output returns (see InterpreterBase); a buffering console sink is
+    # flushed when the run ends.
+    def __init__(
+        self,
+        console_output=True,
+        inp=None,
+        trace_output=False,
+        engine="tree",
+        max_steps=None,
+        max_call_depth=None,
+        time_limit=None,
+        tail_calls=True,
+        optimize=False,
+        dump_ast=False,
+        cache_code=False,
+        memoize=False,
+        memo_size=DEFAULT_MAX_ENTRIES,
+        capture_output=True,
+    ):
+        super().__init__(console_output, inp, capture_output)
+        if engine not in Interpreter.ENGINES:
+            raise ValueError(f"Unknown execution engine {engine}")
+        for name, limit in (
+            ("max_steps", max_steps),
+            ("max_call_depth", max_call_depth),
+            ("time_limit", time_limit),
+            ("memo_size", memo_size),
+        ):
+            if limit is not None and limit <= 0:
+                raise ValueError(f"{name} must be positive")
         self.trace_output = trace_output
+        self.engine = engine
+        self.max_steps = max_steps
+        self.max_call_depth = max_call_depth
+        self.time_limit = time_limit
+        self.tail_calls = tail_calls
+        self.optimize = optimize
+        self.dump_ast = dump_ast
+        self.cache_code = cache_code
+        self.memoize = memoize
+        self.memo_size = memo_size
+        self.memo = None
+        # steps only need counting if there is a limit to check them against
+        self.count_steps = max_steps is not None or time_limit is not None
         self.__setup_ops()
 
-    # run a program that's provided in a string
+    # parses, optimizes (if asked to) and resolves a program once, for any number
+    # of runs, by this interpreter or another, to share
+    def prepare(self, program):
+        ast = parse_program(program)
+        if self.optimize:
+            # a separate interpreter evaluates the constants, so errors raised while
+            # trying to fold don't end up recorded on this one
+            Optimizer(Interpreter(console_output=False)).optimize_program(ast)
+        if self.dump_ast:
+            print(ast)
+        Resolver().resolve_program(ast)
+        return CompiledProgram(ast)
+
+    # run a program that's provided in a string, or one returned by prepare
     # usese the provided Parser found in brewparse.py to parse the program
     # into an abstract syntax tree (ast)
-    def run(self, program):
-        ast = parse_program(program)
-        self.__set_up_function_table(ast)
+    # inp, if given, replaces the inputs the interpreter was created with; the
+    # output and error of the previous run are cleared either way
+    def run(self, program, inp=None):
+        if not isinstance(program, CompiledProgram):
+            program = self.__get_program(program)
+        if inp is not None:
+            self.inp = inp
+        self.reset()
+        self.func_name_to_ast = program.function_table()
         self.env = EnvironmentManager()
+        self.frame_base = None  # index of the running function's call scope in env
+        self.__reset_limits()
+        if self.memoize:
+            self.memo = MemoCache(self.memo_size)
         main_func = self.__get_func_by_name("main", 0)
         if main_func is None:
             super().error(ErrorType.NAME_ERROR, f"Function {name} not found")
-        self.__run_statements(main_func.func_ast.get("statements"))
-
-    def __set_up_function_table(self, ast):
-        self.func_name_to_ast = {}
-        empty_env = EnvironmentManager()
-        for func_def in ast.get("functions"):
-            func_name = func_def.get("name")
-            num_params = len(func_def.get("args"))
-            if func_name not in self.func_name_to_ast:
-                self.func_name_to_ast[func_name] = {}
-            self.func_name_to_ast[func_name][num_params] = Closure(func_def, empty_env)
-
-    def __get_func_by_name(self, name, num_params):
+        try:
+            if self.engine == "vm":
+                code_cache = program.vm_code_cache(
+                    self.trace_output, self.count_steps, self.tail_calls
+                )
+                VirtualMachine(self, code_cache).run(main_func.func_ast)
+            elif self.engine == "closure":
+                ClosureCompiler(self).run(main_func.func_ast)
+            elif self.engine == "python":
+                Transpiler(self).run(program, main_func.func_ast)
+            else:
+                main_ast = main_func.func_ast
+                self.__run_statements(main_ast.statements, main_ast.new_scope)
+        except RecursionError:
+            super().error(
+                ErrorType.RESOURCE_ERROR,
+                "Program exceeded the interpreter's maximum call depth",
+            )
+        finally:
+            self.flush_output()
+
+    # with cache_code, the python engine reuses what it prepared and translated for
+    # the same source run with the same options (see transpilerv4.CODE_CACHE)
+    def __get_program(self, source):
+        if self.engine != "python" or not self.cache_code:
+            return self.prepare(source)
+        key = cache_key(
+            source,
+            (self.optimize, self.trace_output, self.count_steps, self.tail_calls),
+        )
+        program = CODE_CACHE.get(key)
+        if program is None:
+            program = self.prepare(source)
+            cache_program(key, program)
+        elif self.dump_ast:
+            print(program.ast)
+        return program
+
+    def __reset_limits(self):
+        self.steps = 0
+        self.call_depth = 0
+        self.call_depth_limit = (
+            math.inf if self.max_call_depth is None else self.max_call_depth
+        )
+        self.deadline = None
+        if self.time_limit is not None:
+            self.deadline = time.monotonic() + self.time_limit
+        self.__schedule_limit_check()
+
+    # sets the step count at which check_limits next has to run
+    def __schedule_limit_check(self):
+        self.check_at = math.inf
+        if self.max_steps is not None:
+            self.check_at = self.max_steps + 1
+        if self.deadline is not None:
+            self.check_at = min(self.check_at, self.steps + Interpreter.TIME_CHECK_INTERVAL)
+
+    def __get_func_by_name(self, name, num_params, depth=0):
         if name not in self.func_name_to_ast:
-            closure_val_obj = self.env.get(name)
+            closure_val_obj = self.env.get_at(name, depth)
             if closure_val_obj is None:
                 return None
                 # super().error(ErrorType.NAME_ERROR, f"Function {name} not found")
@@ -58,7 +249,7 @@ class Interpreter(InterpreterBase):
                     ErrorType.TYPE_ERROR, "Trying to call function with non-closure"
                 )
             closure = closure_val_obj.value()
-            num_formal_params = len(closure.func_ast.get("args"))
+            num_formal_params = len(closure.func_ast.args)
             if num_formal_params != num_params:
                 super().error(ErrorType.TYPE_ERROR, "Invalid # of args to lambda")
             return closure_val_obj.value()
@@ -84,9 +275,15 @@ class Interpreter(InterpreterBase):
             )
         return candidate_funcs[num_params]
 
-    def __run_statements(self, statements):
-        self.env.push()
+    # new_scope is False for blocks that resolverv4.py found can't create a variable
+    def __run_statements(self, statements, new_scope=True):
+        if new_scope:
+            self.env.push()
         for statement in statements:
+            if self.count_steps:
+                self.steps += 1
+                if self.steps >= self.check_at:
+                    self.check_limits()
             if self.trace_output:
                 print(statement)
             status = ExecStatus.CONTINUE
@@ -105,69 +302,82 @@ class Interpreter(InterpreterBase):
             
 
             if status == ExecStatus.RETURN:
-                self.env.pop()
+                if new_scope:
+                    self.env.pop()
                 return (status, return_val)
 
-        self.env.pop()
+        if new_scope:
+            self.env.pop()
         return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
 
 
     def __call_func(self, call_ast):
-        func_name = call_ast.get("name")
+        func_name = call_ast.name
         if func_name == "print":
             return self.__call_print(call_ast)
         if func_name == "inputi":
             return self.__call_input(call_ast)
 
-        actual_args = call_ast.get("args")
-        target_closure = self.__get_func_by_name(func_name, len(actual_args))
-        if target_closure == None:
-            super().error(ErrorType.NAME_ERROR, f"Function {func_name} not found")
-        if target_closure.type != Type.CLOSURE:
-            super().error(ErrorType.TYPE_ERROR, f"Function {func_name} is changed to non-function type.")
-        target_ast = target_closure.func_ast
-
-        new_env = {}
-        self.__prepare_env_with_closed_variables(target_closure, new_env)
-        self.__prepare_params(target_ast,call_ast, new_env)
-        self.env.push(new_env)
-        _, return_val = self.__run_statements(target_ast.get("statements"))
-        self.env.pop()
+        target_closure, new_env = self.__prepare_call(call_ast)
+        return self.__invoke(target_closure, new_env)
+
+    # returns the closure call_ast calls and its call scope, with the args bound
+    def __prepare_call(self, call_ast):
+        actual_args = call_ast.args
+        target_closure = self.get_callable(call_ast.name, len(actual_args), call_ast.depth)
+        new_env = self.new_call_env(target_closure, len(actual_args))
+        self.__prepare_params(target_closure.func_ast, call_ast, new_env)
+        return target_closure, new_env
+
+    def __invoke(self, target_closure, new_env):
+        memo_key = self.memo_key(target_closure, new_env)
+        if memo_key is not None:
+            return_val = self.memo.get(memo_key)
+            if return_val is not None:
+                return return_val
+        caller_frame_base = self.frame_base
+        self.frame_base = len(self.env.environment)
+        self.enter_call()
+        while True:
+            self.env.push(new_env)
+            func_ast = target_closure.func_ast
+            _, return_val = self.__run_statements(func_ast.statements, func_ast.new_scope)
+            self.env.pop()
+            if not isinstance(return_val, TailCall):
+                break
+            target_closure = return_val.target_closure
+            new_env = return_val.new_env
+        self.call_depth -= 1
+        self.frame_base = caller_frame_base
+        if memo_key is not None:
+            self.memo_store(memo_key, return_val)
         return return_val
 
     def __prepare_env_with_closed_variables(self, target_closure, temp_env):
-        for var_name, value in target_closure.captured_env:
+        captured_env = target_closure.captured_env
+        if not captured_env:
+            return
+        for var_name, value in captured_env.items():
             # Updated here - ignore updates to the scope if we
             #   altered a parameter, or if the argument is a similarly named variable
             temp_env[var_name] = value
 
     def __prepare_params(self, target_ast, call_ast, temp_env):
-        actual_args = call_ast.get("args")
-        formal_args = target_ast.get("args")
-        if len(actual_args) != len(formal_args):
-            super().error(
-                ErrorType.NAME_ERROR,
-                f"Function {target_ast.get('name')} with {len(actual_args)} args not found",
-            )
-
+        actual_args = call_ast.args
+        formal_args = target_ast.args
         for formal_ast, actual_ast in zip(formal_args, actual_args):
-            if formal_ast.elem_type == InterpreterBase.REFARG_DEF:
-                result = self.__eval_expr(actual_ast)
-            else:
-                result = copy.deepcopy(self.__eval_expr(actual_ast))
-            arg_name = formal_ast.get("name")
-            temp_env[arg_name] = result
+            self.bind_arg(formal_ast, self.__eval_expr(actual_ast), temp_env)
 
     def __call_print(self, call_ast):
         output = ""
-        for arg in call_ast.get("args"):
+        for arg in call_ast.args:
             result = self.__eval_expr(arg)  # result is a Value object
             output = output + get_printable(result)
         super().output(output)
         return Interpreter.NIL_VALUE
 
     def __call_input(self, call_ast):
-        args = call_ast.get("args")
+        args = call_ast.args
         if args is not None and len(args) == 1:
             result = self.__eval_expr(args[0])
             super().output(get_printable(result))
@@ -175,12 +385,8 @@ class Interpreter(InterpreterBase):
             super().error(
                 ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
             )
-        inp = super().get_input()
-        if call_ast.get("name") == "inputi":
-            return Value(Type.INT, int(inp))
-        if call_ast.get("name") == "inputs":
-            return Value(Type.STRING, inp)
-        
+        return self.read_input(call_ast.name)
+
     def get_field(self, var_name):
         obj_plus_field = var_name.split('.')
         obj_name = obj_plus_field[0]
@@ -188,16 +394,226 @@ class Interpreter(InterpreterBase):
         return obj_name, field_name
 
     def __assign(self, assign_ast):
+        self.assign_value(
+            assign_ast.name, self.__eval_expr(assign_ast.expression), assign_ast.depth
+        )
+
+    def __eval_expr(self, expr_ast):
+        if expr_ast.elem_type == InterpreterBase.NIL_DEF:
+            return Interpreter.NIL_VALUE
+        if expr_ast.elem_type in (
+            InterpreterBase.INT_DEF, InterpreterBase.STRING_DEF, InterpreterBase.BOOL_DEF
+        ):
+            return expr_ast.value
+        if expr_ast.elem_type == InterpreterBase.VAR_DEF:
+            return self.eval_name(expr_ast.name, expr_ast.depth, expr_ast.cache)
+        if expr_ast.elem_type == InterpreterBase.FCALL_DEF:
+            return self.__call_func(expr_ast)
+        if expr_ast.elem_type in Interpreter.BIN_OPS:
+            return self.__eval_op(expr_ast)
+        if expr_ast.elem_type == Interpreter.NEG_DEF:
+            return self.eval_unary_op(expr_ast.elem_type, self.__eval_expr(expr_ast.op1))
+        if expr_ast.elem_type == Interpreter.NOT_DEF:
+            return self.eval_unary_op(expr_ast.elem_type, self.__eval_expr(expr_ast.op1))
+        if expr_ast.elem_type == Interpreter.LAMBDA_DEF:
+            return Value(Type.CLOSURE, Closure(expr_ast, self.env))
+        if expr_ast.elem_type == Interpreter.OBJ_DEF: 
+            return Value(Type.OBJECT, Object()) # Object instantiation
+        if expr_ast.elem_type == Interpreter.MCALL_DEF:
+            return self.__do_mcall(expr_ast)
+
+    def __eval_op(self, arith_ast):
+        left_value_obj = self.__eval_expr(arith_ast.op1)
+        right_value_obj = self.__eval_expr(arith_ast.op2)
+        # int op int is by far the most common case (loop counters and conditions),
+        # so compute it directly instead of going through eval_bin_op's coercion
+        if left_value_obj.t == Type.INT and right_value_obj.t == Type.INT:
+            int_op = INT_OPS.get(arith_ast.elem_type)
+            if int_op is not None:
+                make_value, operation = int_op
+                return make_value(operation(left_value_obj.v, right_value_obj.v))
+        return self.eval_bin_op(arith_ast.elem_type, left_value_obj, right_value_obj)
+
+    # Operations below are shared by the tree walker and the bytecode VM (vmv4.py),
+    # so both engines produce identical output and errors. They take already
+    # evaluated Value objects rather than AST nodes. depth is the scope the lookup of
+    # the variable involved starts at, as computed by resolverv4.py, and cache is the
+    # call site's InlineCache for member lookups.
+
+    # called with self.steps past check_at, raises if a step or time limit was hit
+    def check_limits(self):
+        if self.max_steps is not None and self.steps > self.max_steps:
+            super().error(
+                ErrorType.RESOURCE_ERROR,
+                f"Program exceeded its limit of {self.max_steps} steps",
+            )
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            super().error(
+                ErrorType.RESOURCE_ERROR,
+                f"Program exceeded its time limit of {self.time_limit} seconds",
+            )
+        self.__schedule_limit_check()
+
+    # whether a tail call to target_closure can run with scopes, the scopes of the
+    # function making it, already dropped: only if none of them binds a name the
+    # call might look up (resolverv4.py works those out)
+    def can_drop_frames(self, target_closure, scopes):
+        names = target_closure.func_ast.external_names
+        if names is None:
+            return False
+        for scope in scopes:
+            if not scope.keys().isdisjoint(names):
+                return False
+        return True
+
+    # called right before a function body runs; the caller decrements call_depth
+    # once it returns
+    def enter_call(self):
+        self.call_depth += 1
+        if self.call_depth > self.call_depth_limit:
+            super().error(
+                ErrorType.RESOURCE_ERROR,
+                f"Program exceeded its limit of {self.max_call_depth} nested calls",
+            )
+
+    # resolves a call to func_name, returning the target closure
+    def get_callable(self, func_name, num_args, depth=0):
+        target_closure = self.__get_func_by_name(func_name, num_args, depth)
+        if target_closure == None:
+            super().error(ErrorType.NAME_ERROR, f"Function {func_name} not found")
+        if target_closure.type != Type.CLOSURE:
+            super().error(ErrorType.TYPE_ERROR, f"Function {func_name} is changed to non-function type.")
+        return target_closure
+
+    # resolves obj_name.func_name(), returning the object Value and the target closure
+    def get_method(self, obj_name, func_name, depth=0, cache=None):
+        # get objref from env
+        # if none, name error
+        # if not an obj, type error
+        obj = self.env.get_at(obj_name, depth)
+        if obj is None:
+            super().error(
+            ErrorType.NAME_ERROR, f"{obj_name} field/method does not exist"
+            )
+        elif not isinstance(obj.value(), Object):
+            super().error(
+            ErrorType.TYPE_ERROR, f"{obj_name} object does not exist"
+            )
+
+        method = obj.v.get_member(func_name, cache)
+        
+        if method == None:
+            super().error(ErrorType.NAME_ERROR, f"Method {func_name} not found")
+        if method.type() != Type.CLOSURE:
+            super().error(ErrorType.TYPE_ERROR, f"Method {func_name} is changed to non-function type.")
+        
+        target_closure = method.v
+        
+        if target_closure == None:
+            super().error(ErrorType.NAME_ERROR, f"Function {func_name} not found")
+        if target_closure.type != Type.CLOSURE:
+            super().error(ErrorType.TYPE_ERROR, f"Function {func_name} is changed to non-function type.")
+        return obj, target_closure
+
+    # builds the scope a call to target_closure runs in, before its arguments are bound
+    def new_call_env(self, target_closure, num_args, this_obj=None):
+        new_env = {}
+        if this_obj is not None:
+            new_env["this"] = this_obj
+        self.__prepare_env_with_closed_variables(target_closure, new_env)
+        target_ast = target_closure.func_ast
+        if num_args != len(target_ast.args):
+            super().error(
+                ErrorType.NAME_ERROR,
+                f"Function {target_ast.get('name')} with {num_args} args not found",
+            )
+        return new_env
+
+    # the memo cache key for a call to target_closure with new_env as its call scope,
+    # or None if the call can't use the cache: memoize is off, the function isn't
+    # pure (see resolverv4.py), an arg isn't an int, string, bool or nil, or a name
+    # the call might look up is bound, so the result could depend on the caller
+    def memo_key(self, target_closure, new_env):
+        if self.memo is None:
+            return None
+        func_ast = target_closure.func_ast
+        if func_ast.elem_type != InterpreterBase.FUNC_DEF or not func_ast.pure:
+            return None
+        # only names some scope could bind need looking for; a binding is most
+        # likely in the nearest callers, so their scopes are searched first
+        names = func_ast.memo_names
+        if names:
+            if not new_env.keys().isdisjoint(names):
+                return None
+            for scope in reversed(self.env.environment):
+                if not scope.keys().isdisjoint(names):
+                    return None
+        key = [func_ast]
+        for formal_ast in func_ast.args:
+            value_obj = new_env[formal_ast.name]
+            if value_obj.t not in Interpreter.MEMO_TYPES:
+                return None
+            key.append((value_obj.t, value_obj.v))
+        return tuple(key)
+
+    # the cache holds constants, so a caller can't change a cached result through a
+    # ref arg
+    def memo_store(self, memo_key, return_val):
+        if return_val.t in Interpreter.MEMO_TYPES:
+            self.memo.put(memo_key, ConstantValue.of(return_val))
+
+    # returned values are passed back the same way as by-value args, so the caller
+    # can't reach a variable or field of the callee through them
+    def return_value(self, value_obj):
+        if isinstance(value_obj, ConstantValue):
+            return value_obj
+        return Interpreter.__copy_by_value(value_obj)
+
+    def bind_arg(self, formal_ast, value_obj, temp_env):
+        if formal_ast.elem_type != InterpreterBase.REFARG_DEF:
+            value_obj = Interpreter.__copy_by_value(value_obj)
+        elif isinstance(value_obj, ConstantValue):
+            value_obj = copy.copy(value_obj)  # the callee may assign to it
+        temp_env[formal_ast.name] = value_obj
+
+    # by-value args and return values get a Value of their own. Ints, strings and
+    # bools can't change in place, so sharing their payload is enough; objects and
+    # closures are copied deeply, so the callee can't change what the caller holds
+    # (see Object and Closure in type_valuev4.py for what the copies share)
+    @staticmethod
+    def __copy_by_value(value_obj):
+        if value_obj.t == Type.OBJECT or value_obj.t == Type.CLOSURE:
+            return copy.deepcopy(value_obj)
+        return copy.copy(value_obj)
+
+    def read_input(self, func_name):
+        inp = super().get_input()
+        if func_name == "inputi":
+            return Value(Type.INT, int(inp))
+        if func_name == "inputs":
+            return Value(Type.STRING, inp)
+
+    # returns the truth value of an if/while condition
+    def check_condition(self, result, statement_kind):
+        if result.type() == Type.INT:
+            result = Interpreter.__int_to_bool(result)
+        if result.type() != Type.BOOL:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible type for {statement_kind} condition",
+            )
+        return result.value()
+
+    def assign_value(self, var_name, value_obj, depth=0):
         obj_flag = False
-        var_name = assign_ast.get("name")
-        src_value_obj = copy.copy(self.__eval_expr(assign_ast.get("expression")))
+        src_value_obj = copy.copy(value_obj)
 
         if "." in var_name: # If we are assigning a method/field
             obj_flag = True
             obj_name, field_name = self.get_field(var_name)
-            target_value_obj = self.env.get(obj_name)
+            target_value_obj = self.env.get_at(obj_name, depth)
         else: # If we are just assigning a normal variable
-            target_value_obj = self.env.get(var_name)
+            target_value_obj = self.env.get_at(var_name, depth)
 
         # If obj_flag is true, we are dealing with an object proto or object field assignment
         if obj_flag: 
@@ -212,7 +628,7 @@ class Interpreter(InterpreterBase):
     
         if target_value_obj is None: 
             # Check if we are instantiating an object ??? or just changing an object attribute/method
-            self.env.set(var_name, src_value_obj)
+            self.env.create(var_name, src_value_obj)
         else:
                         # if a close is changed to another type such as int, we cannot make function calls on it any more 
             if target_value_obj.t == Type.CLOSURE and src_value_obj.t != Type.CLOSURE:
@@ -233,67 +649,36 @@ class Interpreter(InterpreterBase):
 
                 # if target_value_obj.t == Type.OBJECT and field_name is not None:
                 #     target_value_obj.value.fields[field_name] = src_value_obj
-                if src_value_obj.t == Type.OBJECT or src_value_obj.t == Type.CLOSURE: # We set object attributes to other objects or closures via reference
-                    #target_value_obj.v.fields[field_name] = src_value_obj
-                    target_value_obj.v.set_member(field_name, src_value_obj)
-                else: # Set object attributes to other values by deepcopy
-                    #target_value_obj.v.fields[field_name] = copy.deepcopy(src_value_obj)
-                    target_value_obj.v.set_member(field_name, copy.deepcopy(src_value_obj))
+                # src_value_obj is already a copy, so other values are set by value while
+                # objects and closures are set via reference
+                target_value_obj.v.set_member(field_name, src_value_obj)
             else:
                 target_value_obj.set(src_value_obj)
 
-    def __eval_expr(self, expr_ast):
-        if expr_ast.elem_type == InterpreterBase.NIL_DEF:
-            return Interpreter.NIL_VALUE
-        if expr_ast.elem_type == InterpreterBase.INT_DEF:
-            return Value(Type.INT, expr_ast.get("val"))
-        if expr_ast.elem_type == InterpreterBase.STRING_DEF:
-            return Value(Type.STRING, expr_ast.get("val"))
-        if expr_ast.elem_type == InterpreterBase.BOOL_DEF:
-            return Value(Type.BOOL, expr_ast.get("val"))
-        if expr_ast.elem_type == InterpreterBase.VAR_DEF:
-            return self.__eval_name(expr_ast)
-        if expr_ast.elem_type == InterpreterBase.FCALL_DEF:
-            return self.__call_func(expr_ast)
-        if expr_ast.elem_type in Interpreter.BIN_OPS:
-            return self.__eval_op(expr_ast)
-        if expr_ast.elem_type == Interpreter.NEG_DEF:
-            return self.__eval_unary(expr_ast, Type.INT, lambda x: -1 * x)
-        if expr_ast.elem_type == Interpreter.NOT_DEF:
-            return self.__eval_unary(expr_ast, Type.BOOL, lambda x: not x)
-        if expr_ast.elem_type == Interpreter.LAMBDA_DEF:
-            return Value(Type.CLOSURE, Closure(expr_ast, self.env))
-        if expr_ast.elem_type == Interpreter.OBJ_DEF: 
-            return Value(Type.OBJECT, Object()) # Object instantiation
-        if expr_ast.elem_type == Interpreter.MCALL_DEF:
-            return self.__do_mcall(expr_ast)
-
-    def __eval_name(self, name_ast):
-
-        var_name = name_ast.get("name")
+    def eval_name(self, var_name, depth=0, cache=None):
 
         # Need to modify for objects
         if "." in var_name:
             obj_name, field_name = self.get_field(var_name)
-            obj_node = self.env.get(obj_name)
+            obj_node = self.env.get_at(obj_name, depth)
             #print (obj_node)
             if not isinstance(obj_node.v, Object):
                 super().error(
                     ErrorType.TYPE_ERROR, f"Object {obj_name} not found"
                 )
-            if obj_node.v.get_member(field_name) == None:
+            member = obj_node.v.get_member(field_name, cache)
+            if member == None:
                  super().error(
                     ErrorType.NAME_ERROR, f"Method/field {field_name} not found"
                  )
             else:
-                #return obj_node.v.fields[field_name]
-                return obj_node.v.get_member(field_name)
+                return member
 
 
-        val = self.env.get(var_name)
+        val = self.env.get_at(var_name, depth)
         if val is not None:
             return val
-        closure = self.__get_func_by_name(var_name, None)
+        closure = self.__get_func_by_name(var_name, None, depth)
         if closure is None:
             super().error(
                 ErrorType.NAME_ERROR, f"Variable/function {var_name} not found"
@@ -302,28 +687,24 @@ class Interpreter(InterpreterBase):
 
     
 
-    def __eval_op(self, arith_ast):
-        left_value_obj = self.__eval_expr(arith_ast.get("op1"))
-        right_value_obj = self.__eval_expr(arith_ast.get("op2"))
-
-
+    def eval_bin_op(self, oper, left_value_obj, right_value_obj):
         left_value_obj, right_value_obj = self.__bin_op_promotion(
-            arith_ast.elem_type, left_value_obj, right_value_obj
+            oper, left_value_obj, right_value_obj
         )
 
         if not self.__compatible_types(
-            arith_ast.elem_type, left_value_obj, right_value_obj
+            oper, left_value_obj, right_value_obj
         ):
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible types for {arith_ast.elem_type} operation",
+                f"Incompatible types for {oper} operation",
             )
-        if arith_ast.elem_type not in self.op_to_lambda[left_value_obj.type()]:
+        if oper not in self.op_to_lambda[left_value_obj.type()]:
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible operator {arith_ast.elem_type} for type {left_value_obj.type()}",
+                f"Incompatible operator {oper} for type {left_value_obj.type()}",
             )
-        f = self.op_to_lambda[left_value_obj.type()][arith_ast.elem_type]
+        f = self.op_to_lambda[left_value_obj.type()][oper]
         return f(left_value_obj, right_value_obj)
 
     # bool and int, int and bool for and/or/==/!= -> coerce int to bool
@@ -354,11 +735,11 @@ class Interpreter(InterpreterBase):
 
     @staticmethod
     def __int_to_bool(value):
-        return Value(Type.BOOL, value.value() != 0)
+        return bool_value(value.value() != 0)
 
     @staticmethod
     def __bool_to_int(value):
-        return Value(Type.INT, 1 if value.value() else 0)
+        return int_value(1 if value.value() else 0)
 
     def __compatible_types(self, oper, obj1, obj2):
         # DOCUMENT: allow comparisons ==/!= of anything against anything
@@ -366,191 +747,171 @@ class Interpreter(InterpreterBase):
             return True
         return obj1.type() == obj2.type()
 
-    def __eval_unary(self, arith_ast, t, f):
-        value_obj = self.__eval_expr(arith_ast.get("op1"))
-        value_obj = self.__unary_op_promotion(arith_ast.elem_type, value_obj)
+    def eval_unary_op(self, oper, value_obj):
+        if oper == Interpreter.NEG_DEF:
+            t, f = Type.INT, lambda x: int_value(-1 * x)
+        else:
+            t, f = Type.BOOL, lambda x: bool_value(not x)
+        value_obj = self.__unary_op_promotion(oper, value_obj)
 
         if value_obj.type() != t:
             super().error(
                 ErrorType.TYPE_ERROR,
-                f"Incompatible type for {arith_ast.elem_type} operation",
+                f"Incompatible type for {oper} operation",
             )
-        return Value(t, f(value_obj.value()))
+        return f(value_obj.value())
 
     def __setup_ops(self):
         self.op_to_lambda = {}
         # set up operations on integers
         self.op_to_lambda[Type.INT] = {}
-        self.op_to_lambda[Type.INT]["+"] = lambda x, y: Value(
-            x.type(), x.value() + y.value()
+        self.op_to_lambda[Type.INT]["+"] = lambda x, y: int_value(
+            x.value() + y.value()
         )
-        self.op_to_lambda[Type.INT]["-"] = lambda x, y: Value(
-            x.type(), x.value() - y.value()
+        self.op_to_lambda[Type.INT]["-"] = lambda x, y: int_value(
+            x.value() - y.value()
         )
-        self.op_to_lambda[Type.INT]["*"] = lambda x, y: Value(
-            x.type(), x.value() * y.value()
+        self.op_to_lambda[Type.INT]["*"] = lambda x, y: int_value(
+            x.value() * y.value()
         )
-        self.op_to_lambda[Type.INT]["/"] = lambda x, y: Value(
-            x.type(), x.value() // y.value()
+        self.op_to_lambda[Type.INT]["/"] = lambda x, y: int_value(
+            x.value() // y.value()
         )
-        self.op_to_lambda[Type.INT]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.INT]["=="] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.INT]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.INT]["!="] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
-        self.op_to_lambda[Type.INT]["<"] = lambda x, y: Value(
-            Type.BOOL, x.value() < y.value()
+        self.op_to_lambda[Type.INT]["<"] = lambda x, y: bool_value(
+            x.value() < y.value()
         )
-        self.op_to_lambda[Type.INT]["<="] = lambda x, y: Value(
-            Type.BOOL, x.value() <= y.value()
+        self.op_to_lambda[Type.INT]["<="] = lambda x, y: bool_value(
+            x.value() <= y.value()
         )
-        self.op_to_lambda[Type.INT][">"] = lambda x, y: Value(
-            Type.BOOL, x.value() > y.value()
+        self.op_to_lambda[Type.INT][">"] = lambda x, y: bool_value(
+            x.value() > y.value()
         )
-        self.op_to_lambda[Type.INT][">="] = lambda x, y: Value(
-            Type.BOOL, x.value() >= y.value()
+        self.op_to_lambda[Type.INT][">="] = lambda x, y: bool_value(
+            x.value() >= y.value()
         )
         #  set up operations on strings
         self.op_to_lambda[Type.STRING] = {}
         self.op_to_lambda[Type.STRING]["+"] = lambda x, y: Value(
             x.type(), x.value() + y.value()
         )
-        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
         #  set up operations on bools
         self.op_to_lambda[Type.BOOL] = {}
-        self.op_to_lambda[Type.BOOL]["&&"] = lambda x, y: Value(
-            x.type(), x.value() and y.value()
+        self.op_to_lambda[Type.BOOL]["&&"] = lambda x, y: bool_value(
+            x.value() and y.value()
         )
-        self.op_to_lambda[Type.BOOL]["||"] = lambda x, y: Value(
-            x.type(), x.value() or y.value()
+        self.op_to_lambda[Type.BOOL]["||"] = lambda x, y: bool_value(
+            x.value() or y.value()
         )
-        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
 
         #  set up operations on nil
         self.op_to_lambda[Type.NIL] = {}
-        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
 
         #  set up operations on closures
         self.op_to_lambda[Type.CLOSURE] = {}
-        self.op_to_lambda[Type.CLOSURE]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.CLOSURE]["=="] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.CLOSURE]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.CLOSURE]["!="] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
 
         #  set up operations on objects
         self.op_to_lambda[Type.OBJECT] = {}
-        self.op_to_lambda[Type.OBJECT]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
+        self.op_to_lambda[Type.OBJECT]["=="] = lambda x, y: bool_value(
+            x.value() == y.value()
         )
-        self.op_to_lambda[Type.OBJECT]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
+        self.op_to_lambda[Type.OBJECT]["!="] = lambda x, y: bool_value(
+            x.value() != y.value()
         )
 
     def __do_if(self, if_ast):
-        cond_ast = if_ast.get("condition")
+        cond_ast = if_ast.condition
         result = self.__eval_expr(cond_ast)
-        if result.type() == Type.INT:
-            result = Interpreter.__int_to_bool(result)
-        if result.type() != Type.BOOL:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                "Incompatible type for if condition",
-            )
-        if result.value():
-            statements = if_ast.get("statements")
-            status, return_val = self.__run_statements(statements)
+        if self.check_condition(result, "if"):
+            statements = if_ast.statements
+            status, return_val = self.__run_statements(statements, if_ast.new_scope)
             return (status, return_val)
         else:
-            else_statements = if_ast.get("else_statements")
+            else_statements = if_ast.else_statements
             if else_statements is not None:
-                status, return_val = self.__run_statements(else_statements)
+                status, return_val = self.__run_statements(
+                    else_statements, if_ast.else_new_scope
+                )
                 return (status, return_val)
 
         return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
 
+    # Every iteration runs the body in the same scope dict, emptied once the
+    # iteration is done, instead of a new one. Nothing keeps a reference to a block's
+    # scope once it's popped (closures copy the bindings they capture), so no
+    # iteration can see another's variables. The scope is only pushed while the body
+    # runs, so the condition is evaluated in the scopes resolverv4.py expects.
     def __do_while(self, while_ast):
-        cond_ast = while_ast.get("condition")
-        run_while = Interpreter.TRUE_VALUE
-        while run_while.value():
-            run_while = self.__eval_expr(cond_ast)
-            if run_while.type() == Type.INT:
-                run_while = Interpreter.__int_to_bool(run_while)
-            if run_while.type() != Type.BOOL:
-                super().error(
-                    ErrorType.TYPE_ERROR,
-                    "Incompatible type for while condition",
-                )
-            if run_while.value():
-                statements = while_ast.get("statements")
-                status, return_val = self.__run_statements(statements)
-                if status == ExecStatus.RETURN:
-                    return status, return_val
-
-        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+        cond_ast = while_ast.condition
+        statements = while_ast.statements
+        environment = self.env.environment
+        scope = {} if while_ast.new_scope else None
+        while True:
+            result = self.__eval_expr(cond_ast)
+            if result.t == Type.BOOL:
+                run_while = result.v
+            else:
+                run_while = self.check_condition(result, "while")
+            if not run_while:
+                return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+            if scope is None:
+                status, return_val = self.__run_statements(statements, False)
+            else:
+                environment.append(scope)
+                status, return_val = self.__run_statements(statements, False)
+                environment.pop()
+                scope.clear()
+            if status == ExecStatus.RETURN:
+                return status, return_val
 
     def __do_return(self, return_ast):
-        expr_ast = return_ast.get("expression")
+        expr_ast = return_ast.expression
         if expr_ast is None:
             return (ExecStatus.RETURN, Interpreter.NIL_VALUE)
-        value_obj = copy.deepcopy(self.__eval_expr(expr_ast))
+        if return_ast.tail_call and self.tail_calls and self.frame_base is not None:
+            target_closure, new_env = self.__prepare_call(expr_ast)
+            scopes = self.env.environment[self.frame_base:]
+            if self.can_drop_frames(target_closure, scopes):
+                return (ExecStatus.RETURN, TailCall(target_closure, new_env))
+            value_obj = self.return_value(self.__invoke(target_closure, new_env))
+            return (ExecStatus.RETURN, value_obj)
+        value_obj = self.return_value(self.__eval_expr(expr_ast))
         return (ExecStatus.RETURN, value_obj)
     
     def __do_mcall(self, call_ast):
-
-        func_name = call_ast.get("name")
-        # get objref from env
-        # if none, name error
-        # if not an obj, type error
-        obj_name = call_ast.get("objref")
-        obj = self.env.get(obj_name)
-        if obj is None:
-            super().error(
-            ErrorType.NAME_ERROR, f"{obj_name} field/method does not exist"
-            )
-        elif not isinstance(obj.value(), Object):
-            super().error(
-            ErrorType.TYPE_ERROR, f"{obj_name} object does not exist"
-            )
-
-        method = obj.v.get_member(func_name)
-        
-        if method == None:
-            super().error(ErrorType.NAME_ERROR, f"Method {func_name} not found")
-        if method.type() != Type.CLOSURE:
-            super().error(ErrorType.TYPE_ERROR, f"Method {func_name} is changed to non-function type.")
-        
-        actual_args = call_ast.get("args")
-        target_closure = method.v #self.__get_func_by_name(func_name, len(actual_args))
-        
-        if target_closure == None:
-            super().error(ErrorType.NAME_ERROR, f"Function {func_name} not found")
-        if target_closure.type != Type.CLOSURE:
-            super().error(ErrorType.TYPE_ERROR, f"Function {func_name} is changed to non-function type.")
-        target_ast = target_closure.func_ast
-
-        new_env = {}
-        new_env["this"] = obj
-        self.__prepare_env_with_closed_variables(target_closure, new_env)
-        self.__prepare_params(target_ast,call_ast, new_env)
-        self.env.push(new_env)
-        _, return_val = self.__run_statements(target_ast.get("statements"))
-        self.env.pop()
-        return return_val
+        actual_args = call_ast.args
+        obj, target_closure = self.get_method(
+            call_ast.objref, call_ast.name, call_ast.depth, call_ast.cache
+        )
+        new_env = self.new_call_env(target_closure, len(actual_args), obj)
+        self.__prepare_params(target_closure.func_ast, call_ast, new_env)
+        return self.__invoke(target_closure, new_env)
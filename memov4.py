@@ -0,0 +1,42 @@
+# Results of calls to pure functions, used by the v4 interpreter when it is
+# created with memoize=True. resolverv4.py decides which functions are pure and
+# Interpreter.memo_key which calls can use the cache; this only stores the results,
+# dropping the least recently used one once it holds max_entries.
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class MemoCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # returns the cached result for key, or None on a miss
+    def get(self, key):
+        value_obj = self.entries.get(key)
+        if value_obj is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value_obj
+
+    def put(self, key, value_obj):
+        self.entries[key] = value_obj
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+        }
@@ -0,0 +1,159 @@
+# Optional pass over a parsed v4 program, run before the resolver when the
+# interpreter is created with optimize=True. It folds operators applied only to
+# literals into a single literal, and drops identity operands (x * 1, x + 0,
+# b && true, ...) where the other operand's type is known statically.
+#
+# Folding evaluates the operator with the interpreter's own eval_bin_op and
+# eval_unary_op, so int/bool coercion is exactly the same as at runtime. Anything
+# that fails to evaluate (a type error, division by zero) is left as it is, so it
+# still fails at runtime, in the same order. Identities need the type because
+# Brewin coerces: true * 1 is the int 1 and "a" * 1 is a type error, so x * 1 can
+# only become x if x is known to be an int.
+from element import BinOp, BoolLiteral, IntLiteral, Literal, Nil, StringLiteral
+from intbase import InterpreterBase
+from type_valuev4 import Type, constant_value
+
+LITERAL_NODES = {Type.INT: IntLiteral, Type.STRING: StringLiteral, Type.BOOL: BoolLiteral}
+LITERAL_TYPES = {IntLiteral: Type.INT, StringLiteral: Type.STRING, BoolLiteral: Type.BOOL}
+INT_RESULT_OPS = {"-", "*", "/"}
+BOOL_RESULT_OPS = {"==", "!=", "<", "<=", ">", ">=", "&&", "||"}
+
+# operator -> (identity value, whether it may be the left operand, operand type)
+IDENTITIES = {
+    "+": (0, True, Type.INT),
+    "-": (0, False, Type.INT),
+    "*": (1, True, Type.INT),
+    "/": (1, False, Type.INT),
+    "&&": (True, True, Type.BOOL),
+    "||": (False, True, Type.BOOL),
+}
+
+
+class Optimizer:
+    # evaluator is an Interpreter used only to evaluate operators on constants
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+
+    def optimize_program(self, ast):
+        for func_def in ast.functions:
+            self.__optimize_statements(func_def.statements)
+
+    def __optimize_statements(self, statements):
+        for statement in statements:
+            self.__optimize_statement(statement)
+
+    def __optimize_statement(self, statement):
+        elem_type = statement.elem_type
+        if elem_type == "=":
+            statement.expression = self.__optimize_expr(statement.expression)
+        elif elem_type == InterpreterBase.RETURN_DEF:
+            if statement.expression is not None:
+                statement.expression = self.__optimize_expr(statement.expression)
+        elif elem_type == InterpreterBase.IF_DEF:
+            statement.condition = self.__optimize_expr(statement.condition)
+            self.__optimize_statements(statement.statements)
+            if statement.else_statements is not None:
+                self.__optimize_statements(statement.else_statements)
+        elif elem_type == InterpreterBase.WHILE_DEF:
+            statement.condition = self.__optimize_expr(statement.condition)
+            self.__optimize_statements(statement.statements)
+        elif elem_type in (InterpreterBase.FCALL_DEF, InterpreterBase.MCALL_DEF):
+            self.__optimize_expr(statement)
+        # any other expression used as a statement is never evaluated
+
+    # returns the node to use in place of expr_ast
+    def __optimize_expr(self, expr_ast):
+        elem_type = expr_ast.elem_type
+        if elem_type in (InterpreterBase.FCALL_DEF, InterpreterBase.MCALL_DEF):
+            expr_ast.args = [self.__optimize_expr(arg) for arg in expr_ast.args]
+        elif elem_type == InterpreterBase.LAMBDA_DEF:
+            self.__optimize_statements(expr_ast.statements)
+        elif elem_type in (InterpreterBase.NEG_DEF, InterpreterBase.NOT_DEF):
+            expr_ast.op1 = self.__optimize_expr(expr_ast.op1)
+            if self.__is_constant(expr_ast.op1):
+                return self.__fold(
+                    expr_ast,
+                    self.evaluator.eval_unary_op,
+                    elem_type,
+                    self.__constant(expr_ast.op1),
+                )
+        elif isinstance(expr_ast, BinOp):
+            expr_ast.op1 = self.__optimize_expr(expr_ast.op1)
+            expr_ast.op2 = self.__optimize_expr(expr_ast.op2)
+            if self.__is_constant(expr_ast.op1) and self.__is_constant(expr_ast.op2):
+                return self.__fold(
+                    expr_ast,
+                    self.evaluator.eval_bin_op,
+                    elem_type,
+                    self.__constant(expr_ast.op1),
+                    self.__constant(expr_ast.op2),
+                )
+            return self.__simplify(expr_ast)
+        return expr_ast
+
+    # replaces expr_ast with the literal its operator evaluates to, if it can be
+    # evaluated now
+    def __fold(self, expr_ast, evaluate, *operands):
+        try:
+            result = evaluate(*operands)
+        except Exception:
+            return expr_ast  # fails the same way at runtime
+        literal_node = LITERAL_NODES.get(result.t)
+        if literal_node is None:
+            return expr_ast
+        return literal_node(result.v)
+
+    def __simplify(self, bin_op):
+        identity = IDENTITIES.get(bin_op.elem_type)
+        if identity is None:
+            return bin_op
+        value, may_be_left, operand_type = identity
+        if self.__is_identity(bin_op.op2, value, operand_type):
+            if self.__static_type(bin_op.op1) == operand_type:
+                return bin_op.op1
+        elif may_be_left and self.__is_identity(bin_op.op1, value, operand_type):
+            if self.__static_type(bin_op.op2) == operand_type:
+                return bin_op.op2
+        return bin_op
+
+    @staticmethod
+    def __is_identity(expr_ast, value, operand_type):
+        return (
+            isinstance(expr_ast, Literal)
+            and LITERAL_TYPES[type(expr_ast)] == operand_type
+            and expr_ast.val == value
+        )
+
+    # the type expr_ast evaluates to if it evaluates without an error, or None if
+    # that isn't known before running it
+    def __static_type(self, expr_ast):
+        if isinstance(expr_ast, Literal):
+            return LITERAL_TYPES[type(expr_ast)]
+        elem_type = expr_ast.elem_type
+        if elem_type == InterpreterBase.NEG_DEF:
+            return Type.INT
+        if elem_type == InterpreterBase.NOT_DEF:
+            return Type.BOOL
+        if not isinstance(expr_ast, BinOp):
+            return None
+        if elem_type in INT_RESULT_OPS:
+            return Type.INT
+        if elem_type in BOOL_RESULT_OPS:
+            return Type.BOOL
+        # + adds ints (with bools coerced to ints) or concatenates strings
+        left_type = self.__static_type(expr_ast.op1)
+        right_type = self.__static_type(expr_ast.op2)
+        if left_type in (Type.INT, Type.BOOL) and right_type in (Type.INT, Type.BOOL):
+            return Type.INT
+        if left_type == Type.STRING and right_type == Type.STRING:
+            return Type.STRING
+        return None
+
+    @staticmethod
+    def __is_constant(expr_ast):
+        return isinstance(expr_ast, (Literal, Nil))
+
+    def __constant(self, expr_ast):
+        if isinstance(expr_ast, Nil):
+            return self.evaluator.NIL_VALUE
+        return constant_value(LITERAL_TYPES[type(expr_ast)], expr_ast.val)
@@ -0,0 +1,123 @@
+# Destinations for the lines a Brewin program prints. InterpreterBase sends every
+# line to its console sink, which shows it (see its console_output argument), and
+# to its capture sink, which keeps it for get_output (its capture_output argument).
+#
+# A sink has write(line) and flush(). Sinks that keep lines also have lines() and
+# clear(). Sinks that own a file also have close(), and work as context managers.
+import collections
+import sys
+import time
+
+
+class NullSink:
+    def write(self, line):
+        pass
+
+    def flush(self):
+        pass
+
+
+# prints each line as it's written, which is what the interpreters always did
+class PrintSink:
+    def write(self, line):
+        print(line)
+
+    def flush(self):
+        pass
+
+
+# keeps every line
+class CaptureSink:
+    def __init__(self):
+        self.buffer = []
+        self.write = self.buffer.append
+
+    def flush(self):
+        pass
+
+    def lines(self):
+        return self.buffer
+
+    # starts a new list, so lines() returned before this keep their contents
+    def clear(self):
+        self.buffer = []
+        self.write = self.buffer.append
+
+
+# keeps the last max_lines lines, so a chatty program's output doesn't use
+# unbounded memory
+class RingBufferSink:
+    def __init__(self, max_lines):
+        if max_lines <= 0:
+            raise ValueError("max_lines must be positive")
+        self.buffer = collections.deque(maxlen=max_lines)
+        self.write = self.buffer.append
+
+    def flush(self):
+        pass
+
+    def lines(self):
+        return list(self.buffer)
+
+    def clear(self):
+        self.buffer.clear()
+
+
+# collects lines and writes them to stream (sys.stdout when it's None, looked up
+# when the lines are written, so redirecting sys.stdout works) in one call once
+# max_lines of them are waiting or, if flush_interval is set, when a line arrives
+# flush_interval seconds or more after the last write. max_lines=1 writes each line
+# as it arrives, but still without print's overhead
+class BufferedSink:
+    def __init__(self, stream=None, max_lines=1024, flush_interval=None):
+        if max_lines <= 0:
+            raise ValueError("max_lines must be positive")
+        if flush_interval is not None and flush_interval <= 0:
+            raise ValueError("flush_interval must be positive")
+        self.stream = stream
+        self.max_lines = max_lines
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def write(self, line):
+        pending = self.pending
+        pending.append(line)
+        if len(pending) >= self.max_lines or (
+            self.flush_interval is not None
+            and time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.__write_pending()
+
+    def flush(self):
+        self.__write_pending()
+        self.__stream().flush()
+
+    def __write_pending(self):
+        if self.pending:
+            self.pending.append("")  # for the final newline
+            self.__stream().write("\n".join(self.pending))
+            self.pending.clear()
+        if self.flush_interval is not None:
+            self.last_flush = time.monotonic()
+
+    def __stream(self):
+        return sys.stdout if self.stream is None else self.stream
+
+
+# BufferedSink writing to a file it opens, from a path or a file descriptor (e.g. a
+# pipe's write end), and closes on close()
+class FileSink(BufferedSink):
+    def __init__(self, file, mode="w", max_lines=1024, flush_interval=None):
+        super().__init__(open(file, mode), max_lines, flush_interval)
+
+    def close(self):
+        if not self.stream.closed:
+            self.flush()
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,102 @@
+# On-disk cache of parsed programs, consulted by brewparse.parse_program.
+# Each entry is a pickled AST stored under a hash of the grammar version and the
+# program text, so editing brewparse.py/brewlex.py/element.py makes every old entry
+# unreachable; those entries are then aged out by the LRU eviction below.
+# Only point the cache at a directory you trust, since entries are unpickled.
+import hashlib
+import os
+import pickle
+import tempfile
+
+GRAMMAR_FILES = ("brewparse.py", "brewlex.py", "element.py")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def grammar_version():
+    digest = hashlib.sha256()
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    for file_name in GRAMMAR_FILES:
+        with open(os.path.join(source_dir, file_name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ParseCache:
+    SUFFIX = ".ast"
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = grammar_version()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __path(self, program):
+        digest = hashlib.sha256(self.version.encode())
+        digest.update(program.encode())
+        return os.path.join(self.cache_dir, digest.hexdigest() + ParseCache.SUFFIX)
+
+    # returns the cached AST for program, or None on a miss
+    def get(self, program):
+        path = self.__path(program)
+        try:
+            with open(path, "rb") as f:
+                version, ast = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # truncated or otherwise unreadable entry, drop it and reparse
+            self.__remove(path)
+            return None
+        if version != self.version:
+            self.__remove(path)
+            return None
+        try:
+            os.utime(path)  # mark as most recently used
+        except OSError:
+            pass
+        return ast
+
+    def put(self, program, ast):
+        path = self.__path(program)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((self.version, ast), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)  # readers never see a partial entry
+        except (OSError, pickle.PicklingError, RecursionError):
+            return
+        self.__evict()
+
+    # drops least recently used entries until the cache fits in max_bytes
+    def __evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(ParseCache.SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.__remove(path)
+            total -= size
+
+    def clear(self):
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(ParseCache.SUFFIX):
+                    self.__remove(entry.path)
+
+    @staticmethod
+    def __remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
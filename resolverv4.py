@@ -0,0 +1,317 @@
+# Static pass that gives each variable lookup in a v4 program the scope depth its
+# search can start at, so EnvironmentManager.get_at can skip scopes that can't
+# hold the name instead of walking the whole scope chain from the innermost block.
+#
+# Brewin is dynamically scoped, so where a name is bound can't be known in general:
+# a callee sees its callers' variables, and `x = ...` updates an existing x in any
+# caller before it creates a new one. What is known statically is which of the
+# current function's own scopes could hold the name. Inside a function the scopes
+# are, from the bottom, the call scope (parameters, captured variables and `this`)
+# and then one scope per enclosing block. A block's scope only gets new names from
+# assignments directly in that block, and only if the name wasn't already visible.
+# So if name is a parameter or was assigned directly in an enclosing block before
+# the current statement, it is bound in the outermost such scope or somewhere below
+# it, and never in a scope above it; otherwise none of the function's block scopes
+# can hold it and the search starts at the call scope.
+#
+# By the same reasoning, a block whose assignments are all to such names (or to
+# object fields) can never create a variable, so its scope would always stay
+# empty. The pass clears new_scope for those blocks, and they run in the
+# enclosing scope instead; depths only count the scopes that are pushed.
+#
+# The pass also works out which variables a closure over each function has to
+# capture (see Closure in type_valuev4.py), builds the shared Value each literal
+# evaluates to and gives each obj.member lookup its own InlineCache. It also marks
+# returns of function calls as tail calls and works out which names a call to each
+# function might look up in its caller's scopes, which decides whether a tail call
+# can drop the caller's scopes (see Interpreter.can_drop_frames), and which
+# functions are pure enough to memoize (see Interpreter.memo_key).
+from bytecodev4 import LITERAL_TYPES
+from element import BinOp
+from intbase import InterpreterBase
+from type_valuev4 import InlineCache, constant_value
+
+
+class Resolver:
+    BUILTIN_FUNCS = ("print", "inputi")
+
+    def resolve_program(self, ast):
+        self.func_names = {func_def.name for func_def in ast.functions}
+        self.function_values = set()  # names of functions used as values anywhere
+        self.bound_names = {"this"}  # every name any scope could ever bind
+        # FUNC_DEF / LAMBDA_DEF -> (names it uses, names of functions it calls), or
+        # None if it calls a closure or method
+        self.references = {}
+        for func_def in ast.functions:
+            self.__resolve_function(func_def)
+        self.__find_external_names(ast)
+        self.__find_pure_functions(ast)
+
+    # func_ast is a FUNC_DEF or LAMBDA_DEF node
+    def __resolve_function(self, func_ast):
+        params = {arg.name for arg in func_ast.args}
+        self.bound_names |= params
+        func_ast.new_scope = self.__resolve_block(func_ast.statements, [params])
+        names = set()
+        calls = set()
+        if self.__collect_names(func_ast.statements, names, calls):
+            func_ast.captures = None if calls else names - params
+            self.references[func_ast] = (names - params, calls)
+        else:
+            func_ast.captures = None
+            self.references[func_ast] = None
+
+    # a function's external names are everything it or the functions it calls use,
+    # other than their parameters, since any of those could be bound in the scopes
+    # of whoever called it
+    def __find_external_names(self, ast):
+        funcs_by_name = {}
+        for func_def in ast.functions:
+            funcs_by_name.setdefault(func_def.name, []).append(func_def)
+        external_names = {}
+        for func_ast, references in self.references.items():
+            external_names[func_ast] = None if references is None else set(references[0])
+
+        changed = True
+        while changed:
+            changed = False
+            for func_ast, references in self.references.items():
+                names = external_names[func_ast]
+                if names is None:
+                    continue
+                callees = [
+                    callee for name in references[1] for callee in funcs_by_name[name]
+                ]
+                for callee in callees:
+                    callee_names = external_names[callee]
+                    if callee_names is None:
+                        external_names[func_ast] = None
+                        changed = True
+                        break
+                    if not callee_names <= names:
+                        names |= callee_names
+                        changed = True
+
+        for func_ast, names in external_names.items():
+            func_ast.external_names = names
+
+    # A function is pure if, given the same by-value args and called where none of
+    # its external names is bound, it always returns the same result and changes
+    # nothing outside its own scopes. That holds if it and everything it calls only
+    # use their args and variables they create: no output or input, no objects, no
+    # lambdas and no functions used as values. Assigning to a variable holding a
+    # function changes the function's type everywhere, so a function used as a
+    # value anywhere in the program isn't pure either, since its calls can start
+    # failing, and neither is anything that calls it.
+    # A pure function's memo_names are the external names some scope could bind,
+    # the only ones Interpreter.memo_key has to look for.
+    def __find_pure_functions(self, ast):
+        pure = {}
+        for func_def in ast.functions:
+            pure[func_def] = (
+                func_def.external_names is not None
+                and func_def.name not in self.function_values
+                and all(arg.elem_type == InterpreterBase.ARG_DEF for arg in func_def.args)
+                and self.__is_self_contained(func_def.statements)
+            )
+        funcs_by_name = {}
+        for func_def in ast.functions:
+            funcs_by_name.setdefault(func_def.name, []).append(func_def)
+
+        changed = True
+        while changed:
+            changed = False
+            for func_def in ast.functions:
+                if not pure[func_def]:
+                    continue
+                for name in self.references[func_def][1]:
+                    if not all(pure[callee] for callee in funcs_by_name[name]):
+                        pure[func_def] = False
+                        changed = True
+                        break
+
+        for func_def, is_pure in pure.items():
+            func_def.pure = is_pure
+            if is_pure:
+                func_def.memo_names = func_def.external_names & self.bound_names
+
+    # whether the statements or expressions in nodes avoid everything that makes a
+    # function impure other than calls to other functions (see above)
+    def __is_self_contained(self, nodes):
+        for node in nodes:
+            elem_type = node.elem_type
+            if elem_type in ("=", InterpreterBase.VAR_DEF):
+                if "." in node.name:
+                    return False
+                if elem_type == "=":
+                    if not self.__is_self_contained([node.expression]):
+                        return False
+                elif node.name in self.func_names:
+                    return False
+            elif elem_type == InterpreterBase.FCALL_DEF:
+                if node.name in Resolver.BUILTIN_FUNCS:
+                    return False
+                if not self.__is_self_contained(node.args):
+                    return False
+            elif elem_type in (
+                InterpreterBase.MCALL_DEF, InterpreterBase.OBJ_DEF, InterpreterBase.LAMBDA_DEF
+            ):
+                return False
+            elif elem_type == InterpreterBase.RETURN_DEF:
+                if node.expression is not None and not self.__is_self_contained(
+                    [node.expression]
+                ):
+                    return False
+            elif elem_type == InterpreterBase.IF_DEF:
+                if not self.__is_self_contained(
+                    [node.condition] + node.statements + (node.else_statements or [])
+                ):
+                    return False
+            elif elem_type == InterpreterBase.WHILE_DEF:
+                if not self.__is_self_contained([node.condition] + node.statements):
+                    return False
+            elif elem_type in (InterpreterBase.NEG_DEF, InterpreterBase.NOT_DEF):
+                if not self.__is_self_contained([node.op1]):
+                    return False
+            elif isinstance(node, BinOp):
+                if not self.__is_self_contained([node.op1, node.op2]):
+                    return False
+        return True
+
+    # scopes holds the names known to be assigned in each enclosing scope, the call
+    # scope first and the innermost block last. Returns whether the block needs a
+    # scope of its own.
+    def __resolve_block(self, statements, scopes):
+        new_scope = Resolver.__may_create(statements, scopes)
+        if new_scope:
+            scopes = scopes + [set()]
+        for statement in statements:
+            self.__resolve_statement(statement, scopes)
+        return new_scope
+
+    # whether an assignment directly in statements may create a variable
+    @staticmethod
+    def __may_create(statements, scopes):
+        for statement in statements:
+            if statement.elem_type != "=" or "." in statement.name:
+                continue
+            if not any(statement.name in assigned for assigned in scopes):
+                return True
+        return False
+
+    def __resolve_statement(self, statement, scopes):
+        elem_type = statement.elem_type
+        if elem_type == "=":
+            self.__resolve_expr(statement.expression, scopes)
+            statement.depth = Resolver.__depth(statement.name, scopes)
+            if "." not in statement.name:
+                scopes[-1].add(statement.name)
+                self.bound_names.add(statement.name)
+        elif elem_type == InterpreterBase.RETURN_DEF:
+            expr_ast = statement.expression
+            if expr_ast is not None:
+                self.__resolve_expr(expr_ast, scopes)
+                statement.tail_call = (
+                    expr_ast.elem_type == InterpreterBase.FCALL_DEF
+                    and expr_ast.name not in Resolver.BUILTIN_FUNCS
+                )
+        elif elem_type == InterpreterBase.IF_DEF:
+            self.__resolve_expr(statement.condition, scopes)
+            statement.new_scope = self.__resolve_block(statement.statements, scopes)
+            if statement.else_statements is not None:
+                statement.else_new_scope = self.__resolve_block(
+                    statement.else_statements, scopes
+                )
+        elif elem_type == InterpreterBase.WHILE_DEF:
+            self.__resolve_expr(statement.condition, scopes)
+            statement.new_scope = self.__resolve_block(statement.statements, scopes)
+        else:
+            self.__resolve_expr(statement, scopes)
+
+    def __resolve_expr(self, expr_ast, scopes):
+        elem_type = expr_ast.elem_type
+        if elem_type == InterpreterBase.VAR_DEF:
+            expr_ast.depth = Resolver.__depth(expr_ast.name, scopes)
+            if "." in expr_ast.name:
+                expr_ast.cache = InlineCache()
+            elif expr_ast.name in self.func_names:
+                self.function_values.add(expr_ast.name)
+        elif elem_type == InterpreterBase.FCALL_DEF:
+            expr_ast.depth = Resolver.__depth(expr_ast.name, scopes)
+            for arg in expr_ast.args:
+                self.__resolve_expr(arg, scopes)
+        elif elem_type == InterpreterBase.MCALL_DEF:
+            expr_ast.depth = Resolver.__depth(expr_ast.objref, scopes)
+            expr_ast.cache = InlineCache()
+            for arg in expr_ast.args:
+                self.__resolve_expr(arg, scopes)
+        elif elem_type in LITERAL_TYPES:
+            expr_ast.value = constant_value(LITERAL_TYPES[elem_type], expr_ast.val)
+        elif elem_type == InterpreterBase.LAMBDA_DEF:
+            self.__resolve_function(expr_ast)
+        elif elem_type in (InterpreterBase.NEG_DEF, InterpreterBase.NOT_DEF):
+            self.__resolve_expr(expr_ast.op1, scopes)
+        elif isinstance(expr_ast, BinOp):
+            self.__resolve_expr(expr_ast.op1, scopes)
+            self.__resolve_expr(expr_ast.op2, scopes)
+
+    # adds every variable name the statements or expressions in nodes can look up or
+    # assign to names, and the name of every function they call to calls. A callee
+    # can see every variable in its caller's call scope, captured or not. Returns
+    # False if they call a closure or method, whose body isn't known statically.
+    def __collect_names(self, nodes, names, calls):
+        for node in nodes:
+            elem_type = node.elem_type
+            if elem_type in ("=", InterpreterBase.VAR_DEF):
+                names.add(node.name.split(".")[0])
+                if elem_type == "=" and not self.__collect_names(
+                    [node.expression], names, calls
+                ):
+                    return False
+            elif elem_type == InterpreterBase.FCALL_DEF:
+                if node.name not in Resolver.BUILTIN_FUNCS:
+                    if node.name not in self.func_names:
+                        return False
+                    calls.add(node.name)
+                if not self.__collect_names(node.args, names, calls):
+                    return False
+            elif elem_type == InterpreterBase.MCALL_DEF:
+                return False
+            elif elem_type == InterpreterBase.RETURN_DEF:
+                if node.expression is not None and not self.__collect_names(
+                    [node.expression], names, calls
+                ):
+                    return False
+            elif elem_type == InterpreterBase.IF_DEF:
+                if not self.__collect_names(
+                    [node.condition] + node.statements + (node.else_statements or []),
+                    names,
+                    calls,
+                ):
+                    return False
+            elif elem_type == InterpreterBase.WHILE_DEF:
+                if not self.__collect_names(
+                    [node.condition] + node.statements, names, calls
+                ):
+                    return False
+            elif elem_type == InterpreterBase.LAMBDA_DEF:
+                # a nested lambda captures from the scopes this function runs in
+                if node.captures is None:
+                    return False
+                names |= node.captures
+            elif elem_type in (InterpreterBase.NEG_DEF, InterpreterBase.NOT_DEF):
+                if not self.__collect_names([node.op1], names, calls):
+                    return False
+            elif isinstance(node, BinOp):
+                if not self.__collect_names([node.op1, node.op2], names, calls):
+                    return False
+        return True
+
+    # depth of the scope the lookup of var_name (or of obj for obj.field) starts at
+    @staticmethod
+    def __depth(var_name, scopes):
+        name = var_name.split(".")[0]
+        for index, assigned in enumerate(scopes):
+            if name in assigned:
+                return len(scopes) - 1 - index
+        return len(scopes) - 1
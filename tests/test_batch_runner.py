@@ -0,0 +1,158 @@
+# Tests for batch_runner.py: loading jobs from a directory or a JSONL manifest,
+# checking run_batch's arguments, and the status and output each kind of job gets.
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, SOURCE_DIR)
+
+import batch_runner  # noqa: E402
+
+# one program for each status a job can end with
+PROGRAMS = {
+    "1_ok.br": """
+func main() {
+  a = inputi();
+  b = inputi();
+  print(a + b);
+  print("done");
+}
+""",
+    "2_error.br": """
+func main() {
+  print("before");
+  print(1 + "x");
+}
+""",
+    "3_timeout.br": """
+func main() {
+  print("start");
+  i = 0;
+  while (true) {
+    i = i + 1;
+  }
+}
+""",
+    # an unprintable argument makes the interpreter itself raise a TypeError
+    "4_crash.br": """
+func main() {
+  print("start");
+  print(@);
+}
+""",
+}
+INPUTS = {"1_ok.in": "3\n4\n"}
+TIMEOUT = 1
+
+
+def write_files(directory, files):
+    for name, contents in files.items():
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(contents)
+
+
+class LoadJobsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_directory_jobs_are_sorted_and_read_their_inputs(self):
+        write_files(self.path, PROGRAMS)
+        write_files(self.path, INPUTS)
+        write_files(self.path, {"notes.txt": "not a program"})
+        jobs = batch_runner.load_jobs(self.path)
+        self.assertEqual([job["id"] for job in jobs], sorted(PROGRAMS))
+        self.assertEqual(jobs[0]["inputs"], ["3", "4"])
+        self.assertEqual(jobs[1]["inputs"], [])
+        self.assertEqual(jobs[0]["source"], PROGRAMS["1_ok.br"])
+
+    def test_manifest_jobs(self):
+        write_files(self.path, {"prog.br": PROGRAMS["1_ok.br"]})
+        manifest = os.path.join(self.path, "jobs.jsonl")
+        entries = [
+            {"id": "from_path", "path": "prog.br", "inputs": ["1", "2"]},
+            {"source": "func main() { print(1); }"},
+        ]
+        with open(manifest, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.write("\n")
+        jobs = batch_runner.load_jobs(manifest)
+        self.assertEqual(
+            jobs,
+            [
+                {"id": "from_path", "source": PROGRAMS["1_ok.br"], "inputs": ["1", "2"]},
+                {"id": "2", "source": entries[1]["source"], "inputs": []},
+            ],
+        )
+
+    def test_manifest_job_without_a_program(self):
+        manifest = os.path.join(self.path, "jobs.jsonl")
+        with open(manifest, "w") as f:
+            f.write(json.dumps({"id": "nothing"}) + "\n")
+        with self.assertRaises(ValueError):
+            batch_runner.load_jobs(manifest)
+
+
+class RunBatchTest(unittest.TestCase):
+    def test_bad_arguments_are_rejected_at_the_call(self):
+        for options in (
+            {"version": 5},
+            {"version": 3, "engine": "vm"},
+            {"version": 1, "engine": "tree"},
+            {"engine": "no_such_engine"},
+            {"timeout": 0},
+        ):
+            with self.subTest(**options):
+                with self.assertRaises(ValueError):
+                    batch_runner.run_batch([], **options)
+
+    def test_statuses_and_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_files(directory, PROGRAMS)
+            write_files(directory, INPUTS)
+            jobs = batch_runner.load_jobs(directory)
+        results = list(batch_runner.run_batch(jobs, workers=2, timeout=TIMEOUT))
+        self.assertEqual([result["id"] for result in results], sorted(PROGRAMS))
+        ok, error, timeout, crash = results
+
+        self.assertEqual(ok["status"], "ok")
+        self.assertEqual(ok["output"], ["7", "done"])
+        self.assertIsNone(ok["error_type"])
+
+        self.assertEqual(error["status"], "error")
+        self.assertEqual(error["output"], ["before"])
+        self.assertEqual(error["error_type"], "TYPE_ERROR")
+
+        self.assertEqual(timeout["status"], "timeout")
+        self.assertEqual(timeout["output"], ["start"])
+
+        self.assertEqual(crash["status"], "crash")
+        self.assertEqual(crash["output"], ["start"])
+        self.assertTrue(crash["message"].startswith("TypeError"))
+
+    def test_other_versions_and_engines(self):
+        job = {"id": "add", "source": PROGRAMS["1_ok.br"], "inputs": ["3", "4"]}
+        for options in ({"version": 3}, {"engine": "vm"}, {"engine": "python"}):
+            with self.subTest(**options):
+                (result,) = batch_runner.run_batch([job], workers=1, **options)
+                self.assertEqual(result["status"], "ok")
+                self.assertEqual(result["output"], ["7", "done"])
+
+    # a job that reads past its inputs ends, rather than waiting on stdin
+    def test_missing_input(self):
+        job = {"id": "short", "source": PROGRAMS["1_ok.br"], "inputs": ["3"]}
+        (result,) = batch_runner.run_batch([job], workers=1)
+        self.assertEqual(result["status"], "crash")
+        self.assertEqual(result["output"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
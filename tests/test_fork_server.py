@@ -0,0 +1,118 @@
+# Tests for fork_server.py: starts a server on a socket in a temporary directory
+# and checks the results it sends back for requests over the JSON-line protocol.
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, SOURCE_DIR)
+
+import fork_server  # noqa: E402
+from test_batch_runner import PROGRAMS  # noqa: E402
+
+START_TIMEOUT = 30  # seconds to wait for the server's socket to appear
+
+
+@unittest.skipUnless(
+    hasattr(os, "fork") and hasattr(socket, "AF_UNIX"), "needs fork and Unix sockets"
+)
+class ForkServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.socket_path = os.path.join(cls.directory.name, "brewin.sock")
+        cls.server = subprocess.Popen(
+            [sys.executable, os.path.join(SOURCE_DIR, "fork_server.py"), "serve",
+             cls.socket_path],
+            cwd=SOURCE_DIR,
+        )
+        deadline = time.monotonic() + START_TIMEOUT
+        while not os.path.exists(cls.socket_path):
+            if cls.server.poll() is not None or time.monotonic() > deadline:
+                cls.stop_server()
+                raise RuntimeError("fork server didn't start")
+            time.sleep(0.05)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stop_server()
+
+    @classmethod
+    def stop_server(cls):
+        if cls.server.poll() is None:
+            cls.server.send_signal(signal.SIGTERM)
+            cls.server.wait(timeout=10)
+        cls.directory.cleanup()
+
+    def run_program(self, name, **options):
+        return fork_server.run(self.socket_path, PROGRAMS[name], **options)
+
+    def test_statuses(self):
+        ok = self.run_program("1_ok.br", inputs=["3", "4"])
+        self.assertEqual(ok["status"], "ok")
+        self.assertEqual(ok["output"], ["7", "done"])
+
+        error = self.run_program("2_error.br")
+        self.assertEqual(error["status"], "error")
+        self.assertEqual(error["output"], ["before"])
+        self.assertEqual(error["error_type"], "TYPE_ERROR")
+
+        timeout = self.run_program("3_timeout.br", timeout=1)
+        self.assertEqual(timeout["status"], "timeout")
+        self.assertEqual(timeout["output"], ["start"])
+
+        crash = self.run_program("4_crash.br")
+        self.assertEqual(crash["status"], "crash")
+        self.assertEqual(crash["output"], ["start"])
+
+    def test_versions_and_engines(self):
+        for options in ({"version": 3}, {"engine": "vm"}, {"engine": "closure"}):
+            with self.subTest(**options):
+                result = self.run_program("1_ok.br", inputs=["3", "4"], **options)
+                self.assertEqual(result["status"], "ok")
+                self.assertEqual(result["output"], ["7", "done"])
+
+    # a request the server can't run still gets a response, and the server keeps going
+    def test_bad_requests(self):
+        for options in ({"version": 5}, {"version": 3, "engine": "vm"}, {"timeout": -1}):
+            with self.subTest(**options):
+                result = self.run_program("1_ok.br", **options)
+                self.assertEqual(result["status"], "crash")
+                self.assertTrue(result["message"].startswith("ValueError"))
+        self.assertEqual(self.run_program("1_ok.br", inputs=["1", "1"])["status"], "ok")
+
+    def test_protocol(self):
+        request = {"source": "func main() { print(inputi()); }", "inputs": ["5"]}
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.socket_path)
+            with client.makefile("rwb") as stream:
+                stream.write(json.dumps(request).encode() + b"\n")
+                stream.flush()
+                lines = stream.readlines()
+        self.assertEqual(len(lines), 1)
+        result = json.loads(lines[0])
+        self.assertEqual(result["status"], "ok")
+        self.assertEqual(result["output"], ["5"])
+        self.assertEqual(
+            set(result), {"id", "status", "output", "error_type", "error_line", "seconds"}
+        )
+
+    def test_malformed_request(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.socket_path)
+            with client.makefile("rwb") as stream:
+                stream.write(b"not json\n")
+                stream.flush()
+                result = json.loads(stream.readline())
+        self.assertEqual(result["status"], "crash")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+# Regression corpus for the v4 interpreter: runs every program in tests/v4 on each
+# engine, with and without the optional optimizations, and checks that its output
+# and error are the ones recorded in tests/v4/expected.json.
+#
+# expected.json was recorded from the v4 interpreter as it was before any of the
+# performance work, so these tests show the engines still behave exactly like it.
+# To record it again (only when a change in behavior is intended), run
+#
+#     python tests/test_v4_corpus.py --record [SOURCE_DIR]
+#
+# where SOURCE_DIR is the tree whose interpreterv4.py should be recorded (this one
+# by default). A program's inputs, if it reads any, are the lines of its .in file.
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(TESTS_DIR, "v4")
+EXPECTED_PATH = os.path.join(CORPUS_DIR, "expected.json")
+SOURCE_DIR = os.path.dirname(TESTS_DIR)
+
+OPTION_SETS = (
+    {},
+    {"optimize": True},
+    {"memoize": True},
+    {"tail_calls": False},
+)
+
+
+def program_paths():
+    return sorted(glob.glob(os.path.join(CORPUS_DIR, "*.br")))
+
+
+def run_program(interpreter_class, path, **options):
+    with open(path) as f:
+        source = f.read()
+    input_path = path[: -len(".br")] + ".in"
+    inputs = None
+    if os.path.exists(input_path):
+        with open(input_path) as f:
+            inputs = f.read().splitlines()
+    interpreter = interpreter_class(console_output=False, inp=inputs, **options)
+    # some programs print debugging output of their own outside of get_output
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            interpreter.run(source)
+        except Exception:
+            pass
+    error_type, error_line = interpreter.get_error_type_and_line()
+    return {
+        "output": list(interpreter.get_output()),
+        "error_type": None if error_type is None else error_type.name,
+        "error_line": error_line,
+    }
+
+
+class CorpusTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        sys.path.insert(0, SOURCE_DIR)
+        from interpreterv4 import Interpreter
+
+        cls.interpreter_class = Interpreter
+        with open(EXPECTED_PATH) as f:
+            cls.expected = json.load(f)
+
+    def test_every_program_is_recorded(self):
+        names = {os.path.basename(path) for path in program_paths()}
+        self.assertEqual(names, set(self.expected))
+
+    def test_engines_match_recorded_results(self):
+        for path in program_paths():
+            name = os.path.basename(path)
+            for engine in sorted(self.interpreter_class.ENGINES):
+                for options in OPTION_SETS:
+                    with self.subTest(program=name, engine=engine, **options):
+                        result = run_program(
+                            self.interpreter_class, path, engine=engine, **options
+                        )
+                        self.assertEqual(result, self.expected[name])
+
+
+def record(source_dir):
+    sys.path.insert(0, os.path.abspath(source_dir))
+    from interpreterv4 import Interpreter
+
+    expected = {
+        os.path.basename(path): run_program(Interpreter, path)
+        for path in program_paths()
+    }
+    with open(EXPECTED_PATH, "w") as f:
+        json.dump(expected, f, indent=1, sort_keys=True)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--record":
+        record(sys.argv[2] if len(sys.argv) > 2 else SOURCE_DIR)
+    else:
+        unittest.main()
@@ -0,0 +1,451 @@
+# Translates a v4 program into Python source, one Python function per FUNC_DEF /
+# LAMBDA_DEF body, compiles it with compile() and runs it. Blocks, ifs and whiles
+# become Python blocks, ifs and whiles, and int arithmetic and comparisons become
+# Python arithmetic and comparisons, so most of a program runs as plain Python
+# bytecode.
+#
+# Brewin is dynamically scoped, so variables can't become Python locals: the
+# generated code still reads and writes the interpreter's scopes (env), and looks
+# functions up by name and arity at each call, just like the other engines.
+# Anything with non-trivial semantics (calls, assignment to fields, operator
+# promotion, errors) is delegated to the shared operations on
+# interpreterv4.Interpreter, so output and errors are the same as the tree walker's.
+#
+# Values that can't be written as Python source (literals' shared Values, inline
+# caches, lambda ASTs) are referenced by index into a list of constants built
+# alongside the source. A program's translation is kept on its CompiledProgram, one
+# per set of code generation options, so later runs of a prepared program reuse it.
+# With cache_code on, Interpreter.run also keeps each CompiledProgram in
+# CODE_CACHE, under a hash of the Brewin source and the interpreter's options, so
+# running the same source again skips parsing, resolving and translating it.
+#
+# Programs Python can't compile (e.g. loops or expressions nested too deeply) run
+# on the closure compiler instead.
+import copy
+import hashlib
+
+from closurecompilerv4 import ClosureCompiler
+from element import BinOp
+from intbase import ErrorType, InterpreterBase
+from type_valuev4 import (
+    INT_OPS,
+    Closure,
+    Object,
+    Type,
+    Value,
+    bool_value,
+    get_printable,
+    int_value,
+)
+
+CODE_CACHE = {}  # (sha256 of Brewin source, options) -> CompiledProgram
+CODE_CACHE_MAX_ENTRIES = 256
+SOURCE_FILENAME = "<brewin>"
+
+# int op int operators written as Python expressions of the operands' ints
+INT_EXPRESSIONS = {
+    "+": "int_value({0}.v + {1}.v)",
+    "-": "int_value({0}.v - {1}.v)",
+    "*": "int_value({0}.v * {1}.v)",
+    "/": "int_value({0}.v // {1}.v)",
+    "==": "bool_value({0}.v == {1}.v)",
+    "!=": "bool_value({0}.v != {1}.v)",
+    "<": "bool_value({0}.v < {1}.v)",
+    "<=": "bool_value({0}.v <= {1}.v)",
+    ">": "bool_value({0}.v > {1}.v)",
+    ">=": "bool_value({0}.v >= {1}.v)",
+}
+assert INT_EXPRESSIONS.keys() == INT_OPS.keys()
+
+
+# CODE_CACHE's key for source run with options (a tuple of the interpreter options
+# that change how it's prepared or translated)
+def cache_key(source, options):
+    return (hashlib.sha256(source.encode()).hexdigest(),) + options
+
+
+def cache_program(key, program):
+    if len(CODE_CACHE) >= CODE_CACHE_MAX_ENTRIES:
+        del CODE_CACHE[next(iter(CODE_CACHE))]  # the oldest entry
+    CODE_CACHE[key] = program
+
+
+class Transpiler:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+
+    def run(self, program, main_ast):
+        interpreter = self.interpreter
+        options = (interpreter.trace_output, interpreter.count_steps, interpreter.tail_calls)
+        if options not in program.python_code:
+            program.python_code[options] = self.__translate(program.ast)
+        translation = program.python_code[options]
+        if translation is None:
+            ClosureCompiler(interpreter).run(main_ast)
+            return
+        code, constants, body_names = translation
+        namespace = self.__namespace(constants)
+        exec(code, namespace)
+        self.bodies = {
+            func_ast: namespace[name] for func_ast, name in body_names.items()
+        }
+        self.bodies[main_ast]()
+
+    # returns the program's code object, its constants and the name of each body's
+    # Python function, or None if Python can't compile it
+    def __translate(self, ast):
+        try:
+            generator = SourceGenerator(self.interpreter)
+            source, constants, body_names = generator.generate(ast)
+            code = compile(source, SOURCE_FILENAME, "exec")
+        except (SyntaxError, RecursionError, MemoryError):
+            return None
+        return code, constants, body_names
+
+    # the globals the generated code runs with
+    def __namespace(self, constants):
+        interpreter = self.interpreter
+        return {
+            "__builtins__": __builtins__,
+            "consts": constants,
+            "interp": interpreter,
+            "env": interpreter.env.environment,
+            "NIL": interpreter.NIL_VALUE,
+            "INT": Type.INT,
+            "BOOL": Type.BOOL,
+            "CLOSURE": Type.CLOSURE,
+            "OBJECT": Type.OBJECT,
+            "Value": Value,
+            "Closure": Closure,
+            "Object": Object,
+            "int_value": int_value,
+            "bool_value": bool_value,
+            "copy_value": copy.copy,
+            "get_at": interpreter.env.get_at,
+            "eval_name": interpreter.eval_name,
+            "eval_bin_op": interpreter.eval_bin_op,
+            "eval_unary_op": interpreter.eval_unary_op,
+            "check_condition": interpreter.check_condition,
+            "assign_value": interpreter.assign_value,
+            "get_callable": interpreter.get_callable,
+            "get_method": interpreter.get_method,
+            "new_call_env": interpreter.new_call_env,
+            "bind_arg": interpreter.bind_arg,
+            "return_value": interpreter.return_value,
+            "can_drop_frames": interpreter.can_drop_frames,
+            "get_printable": get_printable,
+            "call_print": self.__call_print,
+            "call_input": self.__call_input,
+            "invoke": self.__invoke,
+        }
+
+    # same as Interpreter.__invoke. A body returns a (closure, call scope) pair for a
+    # tail call that can run after the body's own scopes are gone.
+    def __invoke(self, target_closure, new_env):
+        interpreter = self.interpreter
+        memo_key = interpreter.memo_key(target_closure, new_env)
+        if memo_key is not None:
+            return_val = interpreter.memo.get(memo_key)
+            if return_val is not None:
+                return return_val
+        environment = interpreter.env.environment
+        caller_frame_base = interpreter.frame_base
+        interpreter.frame_base = len(environment)
+        interpreter.enter_call()
+        while True:
+            environment.append(new_env)
+            return_val = self.bodies[target_closure.func_ast]()
+            environment.pop()
+            if type(return_val) is not tuple:
+                break
+            target_closure, new_env = return_val
+        interpreter.call_depth -= 1
+        interpreter.frame_base = caller_frame_base
+        if return_val is None:
+            return_val = interpreter.NIL_VALUE
+        if memo_key is not None:
+            interpreter.memo_store(memo_key, return_val)
+        return return_val
+
+    # output is the line already built by the generated code, see SourceGenerator.__fcall
+    def __call_print(self, output):
+        self.interpreter.output(output)
+        return self.interpreter.NIL_VALUE
+
+    # same as Interpreter.__call_input; prompt is the evaluated argument, if any
+    def __call_input(self, func_name, num_args, prompt=None):
+        interpreter = self.interpreter
+        if num_args == 1:
+            interpreter.output(get_printable(prompt))
+        elif num_args > 1:
+            interpreter.error(
+                ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
+            )
+        return interpreter.read_input(func_name)
+
+
+class SourceGenerator:
+    def __init__(self, interpreter):
+        self.trace_output = interpreter.trace_output
+        self.count_steps = interpreter.count_steps
+        self.tail_calls = interpreter.tail_calls
+        self.lines = []
+        self.prepare_lines = []  # functions that set up calls, see __prepare_call
+        self.constants = []
+        self.body_names = {}  # FUNC_DEF / LAMBDA_DEF ast -> Python function name
+        self.pending = []  # bodies still to generate
+        self.temp_count = 0
+        self.call_count = 0
+
+    # returns the program's Python source, the constants it references and the
+    # name of the Python function generated for each function and lambda body
+    def generate(self, ast):
+        for func_def in ast.functions:
+            self.__body_name(func_def)
+        while self.pending:
+            self.__generate_body(self.pending.pop(0))
+        source = "\n".join(self.prepare_lines + self.lines) + "\n"
+        return source, self.constants, self.body_names
+
+    def __body_name(self, func_ast):
+        name = self.body_names.get(func_ast)
+        if name is None:
+            name = f"body_{len(self.body_names)}"
+            self.body_names[func_ast] = name
+            self.pending.append(func_ast)
+        return name
+
+    def __constant(self, value):
+        self.constants.append(value)
+        return f"consts[{len(self.constants) - 1}]"
+
+    def __temp(self, prefix):
+        self.temp_count += 1
+        return f"_{prefix}{self.temp_count}"
+
+    def __emit(self, indent, line, lines=None):
+        if lines is None:
+            lines = self.lines
+        lines.append("    " * indent + line)
+
+    # A body returns None if it runs off its end. Its scopes are popped by the
+    # code generated for each block and return, and its call scope by invoke.
+    def __generate_body(self, func_ast):
+        if func_ast.elem_type == InterpreterBase.FUNC_DEF:
+            self.__emit(0, f"# {func_ast.name}/{len(func_ast.args)}")
+        else:
+            self.__emit(0, "# lambda")
+        self.__emit(0, f"def {self.body_names[func_ast]}():")
+        self.__generate_block(func_ast.statements, 1, 0, func_ast.new_scope)
+        self.__emit(0, "")
+
+    # blocks is the number of the function's block scopes in effect around this one.
+    # new_scope is False for blocks that resolverv4.py found can't create a variable.
+    def __generate_block(self, statements, indent, blocks, new_scope):
+        line_count = len(self.lines)
+        if new_scope:
+            self.__emit(indent, "env.append({})")
+            blocks += 1
+        for statement in statements:
+            self.__generate_statement(statement, indent, blocks)
+        if new_scope:
+            self.__emit(indent, "env.pop()")
+        if len(self.lines) == line_count:
+            self.__emit(indent, "pass")
+
+    # pops the function's block scopes before it returns
+    def __pop_scopes(self, indent, blocks):
+        if blocks:
+            self.__emit(indent, f"del env[-{blocks}:]")
+
+    def __generate_statement(self, statement, indent, blocks):
+        if self.count_steps:
+            self.__emit(indent, "interp.steps += 1")
+            self.__emit(indent, "if interp.steps >= interp.check_at:")
+            self.__emit(indent + 1, "interp.check_limits()")
+        if self.trace_output:
+            self.__emit(indent, f"print({self.__constant(statement)})")
+        elem_type = statement.elem_type
+        if elem_type in (InterpreterBase.FCALL_DEF, InterpreterBase.MCALL_DEF):
+            self.__emit(indent, self.__expr(statement))
+        elif elem_type == "=":
+            self.__generate_assign(statement, indent)
+        elif elem_type == InterpreterBase.RETURN_DEF:
+            self.__generate_return(statement, indent, blocks)
+        elif elem_type == InterpreterBase.IF_DEF:
+            self.__generate_if(statement, indent, blocks)
+        elif elem_type == InterpreterBase.WHILE_DEF:
+            self.__generate_while(statement, indent, blocks)
+        # any other expression used as a statement is never evaluated
+
+    def __generate_assign(self, assign_ast, indent):
+        var_name = assign_ast.name
+        depth = assign_ast.depth
+        expr = self.__expr(assign_ast.expression)
+        if "." in var_name:
+            self.__emit(indent, f"assign_value({var_name!r}, {expr}, {depth})")
+            return
+        # same as Interpreter.assign_value for a plain variable name
+        self.__emit(indent, f"_v = {expr}")
+        self.__emit(indent, f"_s = env[{-1 - depth}]")
+        self.__emit(
+            indent,
+            f"_o = _s[{var_name!r}] if {var_name!r} in _s else get_at({var_name!r}, {depth + 1})",
+        )
+        self.__emit(indent, "if _o is None:")
+        self.__emit(indent + 1, f"env[-1][{var_name!r}] = copy_value(_v)")
+        self.__emit(indent, "elif _o.t is CLOSURE and _v.t is not CLOSURE:")
+        self.__emit(indent + 1, "_o.v.type = _v.t")
+        self.__emit(indent, "else:")
+        self.__emit(indent + 1, "_o.set(_v)")
+
+    def __generate_return(self, return_ast, indent, blocks):
+        expr_ast = return_ast.expression
+        if expr_ast is None:
+            self.__pop_scopes(indent, blocks)
+            self.__emit(indent, "return NIL")
+            return
+        if not (return_ast.tail_call and self.tail_calls):
+            self.__emit(indent, f"_v = return_value({self.__expr(expr_ast)})")
+            self.__pop_scopes(indent, blocks)
+            self.__emit(indent, "return _v")
+            return
+        # same as the tail call path of Interpreter.__do_return
+        prepare_call = self.__prepare_call(expr_ast)
+        self.__emit(indent, "if interp.frame_base is None:")
+        self.__emit(indent + 1, f"_v = return_value(invoke(*{prepare_call}()))")
+        self.__emit(indent, "else:")
+        self.__emit(indent + 1, f"_t, _e = {prepare_call}()")
+        self.__emit(indent + 1, "if can_drop_frames(_t, env[interp.frame_base:]):")
+        self.__pop_scopes(indent + 2, blocks)
+        self.__emit(indent + 2, "return (_t, _e)")
+        self.__emit(indent + 1, "_v = return_value(invoke(_t, _e))")
+        self.__pop_scopes(indent, blocks)
+        self.__emit(indent, "return _v")
+
+    def __generate_if(self, if_ast, indent, blocks):
+        self.__emit(indent, f"_c = {self.__expr(if_ast.condition)}")
+        self.__emit(indent, 'if _c.v if _c.t is BOOL else check_condition(_c, "if"):')
+        self.__generate_block(if_ast.statements, indent + 1, blocks, if_ast.new_scope)
+        if if_ast.else_statements is not None:
+            self.__emit(indent, "else:")
+            self.__generate_block(
+                if_ast.else_statements, indent + 1, blocks, if_ast.else_new_scope
+            )
+
+    def __generate_while(self, while_ast, indent, blocks):
+        self.__emit(indent, "while True:")
+        self.__emit(indent + 1, f"_c = {self.__expr(while_ast.condition)}")
+        self.__emit(
+            indent + 1, 'if not (_c.v if _c.t is BOOL else check_condition(_c, "while")):'
+        )
+        self.__emit(indent + 2, "break")
+        self.__generate_block(
+            while_ast.statements, indent + 1, blocks, while_ast.new_scope
+        )
+
+    # returns a Python expression evaluating expr_ast
+    def __expr(self, expr_ast):
+        elem_type = expr_ast.elem_type
+        if elem_type == InterpreterBase.NIL_DEF:
+            return "NIL"
+        if elem_type in (
+            InterpreterBase.INT_DEF, InterpreterBase.STRING_DEF, InterpreterBase.BOOL_DEF
+        ):
+            return self.__constant(expr_ast.value)
+        if elem_type == InterpreterBase.VAR_DEF:
+            return self.__var(expr_ast)
+        if elem_type == InterpreterBase.FCALL_DEF:
+            return self.__fcall(expr_ast)
+        if elem_type in INT_EXPRESSIONS:
+            return self.__int_bin_op(expr_ast)
+        if isinstance(expr_ast, BinOp):
+            left = self.__expr(expr_ast.op1)
+            right = self.__expr(expr_ast.op2)
+            return f"eval_bin_op({elem_type!r}, {left}, {right})"
+        if elem_type in (InterpreterBase.NEG_DEF, InterpreterBase.NOT_DEF):
+            return f"eval_unary_op({elem_type!r}, {self.__expr(expr_ast.op1)})"
+        if elem_type == InterpreterBase.LAMBDA_DEF:
+            self.__body_name(expr_ast)
+            return f"Value(CLOSURE, Closure({self.__constant(expr_ast)}, interp.env))"
+        if elem_type == InterpreterBase.OBJ_DEF:
+            return "Value(OBJECT, Object())"
+        if elem_type == InterpreterBase.MCALL_DEF:
+            return f"invoke(*{self.__prepare_mcall(expr_ast)}())"
+        return "None"
+
+    def __var(self, var_ast):
+        var_name = var_ast.name
+        depth = var_ast.depth
+        cache = "None" if var_ast.cache is None else self.__constant(var_ast.cache)
+        lookup = f"eval_name({var_name!r}, {depth}, {cache})"
+        if "." in var_name:
+            return lookup
+        scope = f"env[{-1 - depth}]"
+        return f"({scope}[{var_name!r}] if {var_name!r} in {scope} else {lookup})"
+
+    # both operands are evaluated, left first, before either type is checked: in
+    # `a is b is INT` both a and b are evaluated before the first comparison
+    def __int_bin_op(self, bin_op_ast):
+        oper = bin_op_ast.elem_type
+        left = self.__temp("l")
+        right = self.__temp("r")
+        left_expr = self.__expr(bin_op_ast.op1)
+        right_expr = self.__expr(bin_op_ast.op2)
+        int_expr = INT_EXPRESSIONS[oper].format(left, right)
+        return (
+            f"({int_expr} if ({left} := {left_expr}).t is ({right} := {right_expr}).t "
+            f"is INT else eval_bin_op({oper!r}, {left}, {right}))"
+        )
+
+    def __fcall(self, call_ast):
+        args = [self.__expr(arg) for arg in call_ast.args]
+        if call_ast.name == "print":
+            # each argument is made printable and added to the line before the next
+            # one is evaluated, like the tree walker: `"" + a + b` adds a before
+            # evaluating b
+            parts = "".join(f" + get_printable({arg})" for arg in args)
+            return f'call_print(""{parts})'
+        if call_ast.name == "inputi":
+            # the tree walker rejects > 1 argument before evaluating any of them
+            prompt = args[0] if len(args) == 1 else "None"
+            return f"call_input({call_ast.name!r}, {len(args)}, {prompt})"
+        return f"invoke(*{self.__prepare_call(call_ast)}())"
+
+    # generates a function returning the closure call_ast calls and its call scope,
+    # with the args bound, and returns its name
+    def __prepare_call(self, call_ast):
+        num_args = len(call_ast.args)
+        return self.__generate_prepare(
+            [
+                f"_t = get_callable({call_ast.name!r}, {num_args}, {call_ast.depth})",
+                f"_e = new_call_env(_t, {num_args})",
+            ],
+            call_ast.args,
+        )
+
+    def __prepare_mcall(self, call_ast):
+        cache = self.__constant(call_ast.cache)
+        return self.__generate_prepare(
+            [
+                f"_o, _t = get_method({call_ast.objref!r}, {call_ast.name!r}, "
+                f"{call_ast.depth}, {cache})",
+                f"_e = new_call_env(_t, {len(call_ast.args)}, _o)",
+            ],
+            call_ast.args,
+        )
+
+    # each argument is bound right after it is evaluated, matching the tree walker
+    def __generate_prepare(self, lines, args):
+        name = f"prepare_{self.call_count}"
+        self.call_count += 1
+        arg_lines = [
+            f"bind_arg(_t.func_ast.args[{index}], {self.__expr(arg)}, _e)"
+            for index, arg in enumerate(args)
+        ]
+        self.__emit(0, f"def {name}():", self.prepare_lines)
+        for line in lines + arg_lines:
+            self.__emit(1, line, self.prepare_lines)
+        self.__emit(1, "return _t, _e", self.prepare_lines)
+        self.__emit(0, "", self.prepare_lines)
+        return name
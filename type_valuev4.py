@@ -1,8 +1,9 @@
 import copy
+import operator
 
 from enum import Enum
+from types import MappingProxyType
 from intbase import InterpreterBase
-from env_v4 import EnvironmentManager
 
 
 # Enumerated type for our different language data types
@@ -15,59 +16,160 @@ class Type(Enum):
     OBJECT = 6
 
 
+# captured_env maps each captured name to its Value. Nothing changes which Value a
+# name is bound to once the closure is created (calls still update the Values in
+# place), so closures that capture nothing, like every function in the function
+# table, all share the one read-only NO_CAPTURES.
+NO_CAPTURES = MappingProxyType({})
+
+
 class Closure:
     def __init__(self, func_ast, env):
-        # Need to change this so we don't deep copy everything (only primitives)
-        
-        self.captured_env = copy.deepcopy(env)
-        self.closure_capture(self.captured_env, env)
+        self.captured_env = self.closure_capture(env, func_ast.captures)
 
         self.func_ast = func_ast
         self.type = Type.CLOSURE
 
-    def closure_capture(self, env, original_environment):
-        for copied_scope, actual_scope in zip(env.environment, original_environment.environment):
-            for name, obj in copied_scope.items():
-                if obj.type() == Type.OBJECT or obj.type() == Type.CLOSURE:
-                    copied_scope[name] = actual_scope[name]
+    # a deep copy (made when a closure is passed or returned by value) gets copies
+    # of the captured Values but shares the function's AST, which the engines key
+    # their compiled code and caches on
+    def __deepcopy__(self, memo):
+        closure = copy.copy(self)
+        memo[id(self)] = closure
+        if self.captured_env:
+            closure.captured_env = copy.deepcopy(self.captured_env, memo)
+        return closure
+
+    # captures the visible binding of each name in names (every visible variable if
+    # names is None). Objects and closures are captured by reference; other values
+    # get a copy so later assignments outside the closure don't reach it. Their
+    # contents are immutable, so a shallow copy is enough.
+    def closure_capture(self, original_environment, names=None):
+        if names is None:
+            bindings = original_environment
+        else:
+            bindings = []
+            for name in names:
+                value_obj = original_environment.get(name)
+                if value_obj is not None:
+                    bindings.append((name, value_obj))
+
+        captured = {}
+        copies = {}  # names bound to the same Value (e.g. via a ref arg) stay aliased
+        for name, value_obj in bindings:
+            if value_obj.t == Type.OBJECT or value_obj.t == Type.CLOSURE:
+                captured[name] = value_obj
+                continue
+            value_copy = copies.get(id(value_obj))
+            if value_copy is None:
+                value_copy = copies[id(value_obj)] = copy.copy(value_obj)
+            captured[name] = value_copy
+        return captured if captured else NO_CAPTURES
+
+# Field layout shared by every object that got the same fields in the same order
+# (a hidden class). Adding a field moves an object to the next shape along a
+# transition, so objects built the same way end up sharing shapes.
+class Shape:
+    def __init__(self, field_names):
+        self.field_names = field_names
+        self.index = {name: i for i, name in enumerate(field_names)}
+        self.transitions = {}
+
+    # shapes never change once made, so copies of an object share them
+    def __deepcopy__(self, memo):
+        return self
+
+    def with_field(self, member_name):
+        shape = self.transitions.get(member_name)
+        if shape is None:
+            shape = Shape(self.field_names + (member_name,))
+            self.transitions[member_name] = shape
+        return shape
+
+
+# every object starts out with just its proto field, at index 0
+ROOT_SHAPE = Shape(("proto",))
+
 
 class Object:
+    # bumped whenever a prototype gets a new field or a new proto, which can change
+    # what a member lookup on any object inheriting from it finds
+    epoch = 0
+
     def __init__(self):
-        self.fields = {"proto": None}
-        self.proto = None # __proto__ ???
+        self.shape = ROOT_SHAPE
+        self.slots = [None]
+        self.is_proto = False
         self.type = Type.OBJECT
-    
-    def get_member(self, member_name):
-        # First search current object members
-
-       
-        if member_name in self.fields:
-            return self.fields[member_name]
-        # Then search prototype's members
-        proto = self.fields["proto"]
-        #print (proto.v)
-        if proto is not None:
-            #proto_obj = self.proto
-            while proto and proto.value() != InterpreterBase.NIL_DEF:
-                print("proto", proto.value())
-                if member_name in proto.v.fields:
-                    return proto.v.fields[member_name] # Be careful, does this work on recursive calls to proto? and will it call fields correctly from derived object?
-                proto = proto.v.fields["proto"]
-        # obj_proto = proto_dict[self]
-        # while obj_proto is not None and obj_proto != InterpreterBase.NIL_DEF:
-        #     if member_name in obj_proto.fields:
-        #         return obj_proto.fields[member_name] # same as finding a member of a normal object, but just for its proto
-        #     else:
-        #         obj_proto = proto_dict[obj_proto] # If not found in this proto, check the proto's proto
-        return None
-    
-    def set_member(self, member_name, field_or_obj):
-        self.fields[member_name] = field_or_obj
 
+    # returns the object on the proto chain that holds member_name and the index of
+    # the member in it, or (None, None) if no object on the chain has it
+    def find_member(self, member_name):
+        obj = self
+        while True:
+            index = obj.shape.index.get(member_name)
+            if index is not None:
+                return obj, index
+            proto = obj.slots[0]
+            if proto is None or proto.value() == InterpreterBase.NIL_DEF:
+                return None, None
+            obj = proto.v
 
+    # cache is the InlineCache of the call site doing the lookup, if it has one
+    def get_member(self, member_name, cache=None):
+        if cache is not None:
+            return cache.get_member(self, member_name)
+        holder, index = self.find_member(member_name)
+        if holder is None:
+            return None
+        return holder.slots[index]
 
+    def set_member(self, member_name, field_or_obj):
+        if member_name == "proto":
+            field_or_obj = ProtoValue(field_or_obj.t, field_or_obj.v)
+            if isinstance(field_or_obj.v, Object):
+                field_or_obj.v.is_proto = True
+            if self.is_proto:
+                Object.epoch += 1
+        index = self.shape.index.get(member_name)
+        if index is not None:
+            self.slots[index] = field_or_obj
+            return
+        self.shape = self.shape.with_field(member_name)
+        self.slots.append(field_or_obj)
+        if self.is_proto:
+            Object.epoch += 1
 
 
+# Remembers where the last member lookup at one call site (an obj.member read or
+# an obj.method() call) found the member. The next lookup reuses that as long as
+# the object has the same shape and proto and no prototype changed since.
+class InlineCache:
+    def __init__(self):
+        self.shape = None
+        self.proto = None
+        self.epoch = -1
+        self.holder = None
+        self.index = None
+
+    def get_member(self, obj, member_name):
+        proto = obj.slots[0]
+        if (
+            obj.shape is not self.shape
+            or proto is not self.proto
+            or self.epoch != Object.epoch
+        ):
+            holder, index = obj.find_member(member_name)
+            if holder is None:
+                return None
+            self.shape = obj.shape
+            self.proto = proto
+            self.epoch = Object.epoch
+            self.holder = None if holder is obj else holder  # own members vary by object
+            self.index = index
+        holder = obj if self.holder is None else self.holder
+        return holder.slots[self.index]
+
 
 # Represents a value, which has a type and its value
 class Value:
@@ -86,6 +188,79 @@ class Value:
         self.v = other.v
 
 
+# A Value shared by everything that evaluates to the same constant: nil, true,
+# false, small ints and each literal in the program. It must never be changed in
+# place, so its copies are plain Values, and code that is going to update a Value
+# (a new variable binding, a ref arg) copies it first.
+class ConstantValue(Value):
+    def set(self, other):
+        raise TypeError("constant Values can't be assigned to")
+
+    def __copy__(self):
+        return Value(self.t, self.v)
+
+    def __deepcopy__(self, memo):
+        return Value(self.t, self.v)
+
+    @staticmethod
+    def of(value_obj):
+        return ConstantValue(value_obj.t, value_obj.v)
+
+
+# The proto field of an object. It can still be changed in place, e.g. when it is
+# passed to a ref arg, so that counts as a prototype change too.
+class ProtoValue(Value):
+    def set(self, other):
+        super().set(other)
+        if isinstance(other.v, Object):
+            other.v.is_proto = True
+        Object.epoch += 1
+
+    def __copy__(self):
+        return Value(self.t, self.v)
+
+
+TRUE = ConstantValue(Type.BOOL, True)
+FALSE = ConstantValue(Type.BOOL, False)
+SMALL_INT_MIN = -128
+SMALL_INT_MAX = 1024
+SMALL_INTS = [ConstantValue(Type.INT, n) for n in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+
+def int_value(n):
+    if SMALL_INT_MIN <= n <= SMALL_INT_MAX:
+        return SMALL_INTS[n - SMALL_INT_MIN]
+    return Value(Type.INT, n)
+
+
+def bool_value(b):
+    return TRUE if b else FALSE
+
+
+# INT op INT, computed directly by both engines' fast paths; identical to
+# Interpreter.op_to_lambda[Type.INT]
+INT_OPS = {
+    "+": (int_value, operator.add),
+    "-": (int_value, operator.sub),
+    "*": (int_value, operator.mul),
+    "/": (int_value, operator.floordiv),
+    "==": (bool_value, operator.eq),
+    "!=": (bool_value, operator.ne),
+    "<": (bool_value, operator.lt),
+    "<=": (bool_value, operator.le),
+    ">": (bool_value, operator.gt),
+    ">=": (bool_value, operator.ge),
+}
+
+
+def constant_value(t, v):
+    if t == Type.BOOL:
+        return bool_value(v)
+    if t == Type.INT and SMALL_INT_MIN <= v <= SMALL_INT_MAX:
+        return SMALL_INTS[v - SMALL_INT_MIN]
+    return ConstantValue(t, v)
+
+
 def create_value(val):
     if val == InterpreterBase.TRUE_DEF:
         return Value(Type.BOOL, True)
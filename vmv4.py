@@ -0,0 +1,215 @@
+# Stack VM that runs the bytecode produced by bytecodev4.Compiler. Anything with
+# non-trivial semantics (calls, assignment to fields, operator promotion, errors)
+# is delegated to the shared operations on interpreterv4.Interpreter so the VM
+# behaves exactly like the tree walker.
+#
+# Brewin calls don't nest Python calls: the frames of suspended callers are kept
+# on a list, so recursion depth is bounded by memory (and the interpreter's
+# max_call_depth) rather than Python's recursion limit.
+import copy
+
+from bytecodev4 import (
+    BINARY_OP,
+    BIND_ARG,
+    CALL,
+    INPUT,
+    JUMP,
+    JUMP_IF_FALSE,
+    LOAD_LITERAL,
+    LOAD_NAME,
+    LOAD_NIL,
+    LOAD_NONE,
+    MAKE_CLOSURE,
+    NEW_OBJECT,
+    POP_SCOPE,
+    POP_TOP,
+    PREPARE_CALL,
+    PREPARE_MCALL,
+    PRINT,
+    PRINT_ARG,
+    PRINT_BEGIN,
+    PUSH_SCOPE,
+    RETURN_NIL,
+    RETURN_VALUE,
+    STEP,
+    STORE_FIELD,
+    STORE_NAME,
+    TAIL_CALL,
+    TRACE,
+    UNARY_OP,
+    Compiler,
+)
+from intbase import ErrorType
+from type_valuev4 import INT_OPS, Closure, Object, Type, Value, get_printable
+
+
+class VirtualMachine:
+    # code_cache lets runs of the same program compiled with the same options share
+    # their bytecode (see CompiledProgram)
+    def __init__(self, interpreter, code_cache=None):
+        self.interpreter = interpreter
+        self.compiler = Compiler(
+            interpreter.trace_output, interpreter.count_steps, interpreter.tail_calls
+        )
+        # FUNC_DEF / LAMBDA_DEF ast -> compiled bytecode
+        self.code_cache = {} if code_cache is None else code_cache
+
+    def run(self, main_ast):
+        self.__execute(self.__get_code(main_ast))
+
+    def __get_code(self, func_ast):
+        code = self.code_cache.get(func_ast)
+        if code is None:
+            code = self.compiler.compile_function(func_ast)
+            self.code_cache[func_ast] = code
+        return code
+
+    # runs the body of main, along with everything it calls
+    def __execute(self, code):
+        interpreter = self.interpreter
+        environment = interpreter.env.environment
+        INT, BOOL, CLOSURE = Type.INT, Type.BOOL, Type.CLOSURE
+        # suspended callers: (code, pc, operand stack, scope count, memo cache key
+        # for the call's result)
+        frames = []
+        stack = []
+        pc = 0
+        while True:
+            op, arg = code[pc]
+            pc += 1
+            if op == LOAD_NAME:
+                var_name, depth, cache = arg
+                scope = environment[-1 - depth]
+                if var_name in scope:
+                    stack.append(scope[var_name])
+                else:
+                    stack.append(interpreter.eval_name(var_name, depth, cache))
+            elif op == LOAD_LITERAL:
+                stack.append(arg)
+            elif op == BINARY_OP:
+                right = stack.pop()
+                left = stack[-1]
+                if left.t == INT and right.t == INT and arg in INT_OPS:
+                    make_value, f = INT_OPS[arg]
+                    stack[-1] = make_value(f(left.v, right.v))
+                else:
+                    stack[-1] = interpreter.eval_bin_op(arg, left, right)
+            elif op == STORE_NAME:
+                # same as Interpreter.assign_value for a plain variable name
+                var_name, depth = arg
+                value_obj = stack.pop()
+                scope = environment[-1 - depth]
+                if var_name in scope:
+                    target_value_obj = scope[var_name]
+                else:
+                    target_value_obj = interpreter.env.get_at(var_name, depth + 1)
+                if target_value_obj is None:
+                    environment[-1][var_name] = copy.copy(value_obj)
+                elif target_value_obj.t == CLOSURE and value_obj.t != CLOSURE:
+                    target_value_obj.v.type = value_obj.t
+                else:
+                    target_value_obj.set(value_obj)
+            elif op == JUMP_IF_FALSE:
+                cond = stack.pop()
+                if cond.t == BOOL:
+                    if not cond.v:
+                        pc = arg[0]
+                elif not interpreter.check_condition(cond, arg[1]):
+                    pc = arg[0]
+            elif op == JUMP:
+                pc = arg
+            elif op == PUSH_SCOPE:
+                environment.append({})
+            elif op == POP_SCOPE:
+                environment.pop()
+            elif op == PREPARE_CALL:
+                target_closure = interpreter.get_callable(arg[0], arg[1], arg[2])
+                stack.append(target_closure)
+                stack.append(interpreter.new_call_env(target_closure, arg[1]))
+            elif op == BIND_ARG:
+                value_obj = stack.pop()
+                formal_ast = stack[-2].func_ast.args[arg]
+                interpreter.bind_arg(formal_ast, value_obj, stack[-1])
+            elif op == CALL or op == TAIL_CALL:
+                new_env = stack.pop()
+                target_closure = stack.pop()
+                memo_key = interpreter.memo_key(target_closure, new_env)
+                if memo_key is not None:
+                    return_val = interpreter.memo.get(memo_key)
+                    if return_val is not None:
+                        stack.append(return_val)
+                        continue
+                if (
+                    op == TAIL_CALL
+                    and frames
+                    and interpreter.can_drop_frames(
+                        target_closure, environment[frames[-1][3]:]
+                    )
+                ):
+                    # the callee returns straight to our caller, which gets its
+                    # result as ours
+                    del environment[frames[-1][3]:]
+                else:
+                    frames.append((code, pc, stack, len(environment), memo_key))
+                    interpreter.enter_call()
+                environment.append(new_env)
+                code = self.__get_code(target_closure.func_ast)
+                pc = 0
+                stack = []
+            elif op == RETURN_VALUE or op == RETURN_NIL:
+                if op == RETURN_VALUE:
+                    return_val = interpreter.return_value(stack.pop())
+                else:
+                    return_val = interpreter.NIL_VALUE
+                if not frames:
+                    return return_val
+                interpreter.call_depth -= 1
+                code, pc, stack, scope_count, memo_key = frames.pop()
+                del environment[scope_count:]
+                if memo_key is not None:
+                    interpreter.memo_store(memo_key, return_val)
+                stack.append(return_val)
+            elif op == POP_TOP:
+                stack.pop()
+            elif op == LOAD_NIL:
+                stack.append(interpreter.NIL_VALUE)
+            elif op == UNARY_OP:
+                stack[-1] = interpreter.eval_unary_op(arg, stack[-1])
+            elif op == PREPARE_MCALL:
+                obj, target_closure = interpreter.get_method(arg[0], arg[1], arg[3], arg[4])
+                stack.append(target_closure)
+                stack.append(interpreter.new_call_env(target_closure, arg[2], obj))
+            elif op == PRINT_BEGIN:
+                stack.append("")
+            elif op == PRINT_ARG:
+                value_obj = stack.pop()
+                stack[-1] = stack[-1] + get_printable(value_obj)
+            elif op == PRINT:
+                interpreter.output(stack.pop())
+                stack.append(interpreter.NIL_VALUE)
+            elif op == MAKE_CLOSURE:
+                stack.append(Value(Type.CLOSURE, Closure(arg, interpreter.env)))
+            elif op == NEW_OBJECT:
+                stack.append(Value(Type.OBJECT, Object()))
+            elif op == INPUT:
+                stack.append(self.__call_input(arg[0], arg[1], stack))
+            elif op == STEP:
+                interpreter.steps += 1
+                if interpreter.steps >= interpreter.check_at:
+                    interpreter.check_limits()
+            elif op == TRACE:
+                print(arg)
+            elif op == STORE_FIELD:
+                interpreter.assign_value(arg[0], stack.pop(), arg[1])
+            elif op == LOAD_NONE:
+                stack.append(None)
+
+    def __call_input(self, func_name, num_args, stack):
+        interpreter = self.interpreter
+        if num_args == 1:
+            interpreter.output(get_printable(stack.pop()))
+        elif num_args > 1:
+            interpreter.error(
+                ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
+            )
+        return interpreter.read_input(func_name)